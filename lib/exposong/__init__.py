@@ -59,6 +59,10 @@ parser.add_option('-o', '--log', dest='log', action='store',
                   help='Write the log to a file.')
 parser.add_option('-i', '--import', dest='import_', action='append',
                   help='Import an ExpoSong data file. Can import for existing program.')
+parser.add_option('--timing', dest='timing', action='store_true',
+                  help='Record how long drawing the screen takes. The times are shown in the event log window.')
+parser.add_option('--timing-file', dest='timing_file', action='store',
+                  help='Write the drawing times to a file on exit. Implies --timing.')
 
 group = OptionGroup(parser, 'Locations')
 group.add_option('-d', '--data-path', dest='data_path', action='store',
@@ -128,6 +132,10 @@ if options.log:
     _handler.setFormatter(_fmt)
     log.addHandler(_handler)
 
+# Record drawing times.
+import exposong.timing
+exposong.timing.enabled = bool(options.timing or options.timing_file)
+
 log.info("Starting ExpoSong.")
 
 # Send exceptoins to our logger.
@@ -78,6 +78,9 @@ class Config(ConfigParser.SafeConfigParser):
         self.setcolor("screen", "logo_bg", (65535, 43690, 4369))
         self.setcolor("screen", "notify_color", (65535, 65535, 65535))
         self.setcolor("screen", "notify_bg", (65535, 0, 0))
+        self.set("screen", "uniform_font", "False")
+        self.set("screen", "transition", "none")
+        self.set("screen", "transition_time", "400")
         
         self.set("updates", "check_for_updates", "True")
         self.set("updates", "last_check", "")
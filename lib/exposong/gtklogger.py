@@ -25,6 +25,8 @@ import gobject
 import gtk
 import os.path
 
+import exposong.timing
+
 _SEV_LEVELS = ['CRITICAL','ERROR','WARNING','INFO','DEBUG']
 
 class GTKHandler (logging.Handler, object):
@@ -67,6 +69,7 @@ class GTKHandler (logging.Handler, object):
         win.set_default_size(600, 400)
         win.connect("destroy", self._destroy)
         win.connect("response", self._destroy)
+        events = gtk.VBox()
         hbox = gtk.HBox()
         hbox.pack_start(gtk.Label(_("Filter Severity:")), False, True, 4)
         combo = gtk.combo_box_new_text()
@@ -77,7 +80,7 @@ class GTKHandler (logging.Handler, object):
         combo.connect("changed", lambda combo: self._refilter(list_))
         hbox.pack_start(combo, True, True, 4)
         list_.set_visible_func(self._row_filter, combo)
-        win.vbox.pack_start(hbox, False, True, 4)
+        events.pack_start(hbox, False, True, 4)
         
         treeview = gtk.TreeView()
         cell = gtk.CellRendererText()
@@ -112,11 +115,46 @@ class GTKHandler (logging.Handler, object):
         self.scroll.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
         self.scroll.add(treeview)
         self.scroll.show_all()
-        win.vbox.pack_start(self.scroll, True, True, 4)
+        events.pack_start(self.scroll, True, True, 4)
+        
+        if exposong.timing.enabled:
+            notebook = gtk.Notebook()
+            notebook.append_page(events, gtk.Label(_("Events")))
+            notebook.append_page(self._get_timing_page(win),
+                                 gtk.Label(_("Drawing Times")))
+            win.vbox.pack_start(notebook, True, True, 4)
+        else:
+            win.vbox.pack_start(events, True, True, 4)
         
         win.show_all()
         gobject.timeout_add(150, self.scroll_to_end)
     
+    def _get_timing_page(self, win):
+        "Return a table of the times recorded by `exposong.timing`."
+        model = gtk.ListStore(str, int, str, str, str)
+        treeview = gtk.TreeView(model)
+        for i, title in enumerate((_('Stage'), _('Count'), _('Mean (ms)'),
+                                   _('Max (ms)'), _('Last (ms)'))):
+            col = gtk.TreeViewColumn(title, gtk.CellRendererText(), text=i)
+            col.set_resizable(True)
+            treeview.append_column(col)
+        
+        def update():
+            "Show the current times."
+            model.clear()
+            for row in exposong.timing.get_summary():
+                model.append([row[0], row[1]] +
+                             ["%.2f" % (t * 1000) for t in row[2:]])
+            return True
+        update()
+        timeout = gobject.timeout_add(1000, update)
+        win.connect("destroy", lambda win: gobject.source_remove(timeout))
+        
+        scroll = gtk.ScrolledWindow()
+        scroll.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        scroll.add(treeview)
+        return scroll
+    
     def scroll_to_end(self):
         "Scroll the list to the most recent log entry."
         if self.scroll:
@@ -0,0 +1,357 @@
+#
+# vim: ts=4 sw=4 expandtab ai:
+#
+# Copyright (C) 2008-2011 Exposong.org
+#
+# ExpoSong is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The image cache keeps the pixbufs of image files for all themes and slides, so
+that an image used in many places is only read and scaled once.
+
+Pixbufs are stored by filename, modification time, size and aspect. The
+original image is stored with a size of None. When the cache is larger than its
+byte budget, the least recently used pixbufs are removed.
+
+Large images are read at about the size they are shown at, and a copy at that
+size is saved in DATA_PATH/.cache/images, so they are read faster next time.
+Copies of older versions of a file are removed when a new copy is saved, and
+the least recently used copies are removed when there are more than
+COPY_BYTES of them.
+
+Images that are not cached are read and scaled by worker threads, so that the
+screen is not blocked. Until an image is ready, `load()` returns None and
+nothing is drawn in its place. The "image-loaded" signal is emitted when the
+image can be drawn.
+"""
+
+import Queue
+import glob
+import gobject
+import gtk.gdk
+import hashlib
+import math
+import os
+import threading
+
+import exposong
+import exposong.theme
+import exposong.timing
+from exposong import DATA_PATH
+
+# The memory that may be used by images (about 24 images at 1080p).
+CACHE_BYTES = 192 * 1024 * 1024
+
+# The disk space that may be used by the reduced copies of images.
+COPY_BYTES = 256 * 1024 * 1024
+
+# The number of threads that read images.
+WORKERS = 2
+
+cache = None # will hold the ImageCache instance
+
+
+class ImageCache(gobject.GObject):
+    """
+    A cache of image pixbufs, limited by size in bytes.
+    
+    If `threaded` is False, images are read in the calling thread.
+    """
+    __gsignals__ = {'image-loaded': (gobject.SIGNAL_RUN_FIRST,
+                                     gobject.TYPE_NONE, ())}
+    
+    def __init__(self, max_bytes=CACHE_BYTES):
+        gobject.GObject.__init__(self)
+        self.max_bytes = max_bytes
+        self.threaded = True
+        # Increased every time a missing image is returned as None.
+        self.misses = 0
+        self._pixbufs = {}
+        self._order = []  # keys, least recently used first
+        self._bytes = 0
+        self._pending = set()
+        self._failed = set() # keys of images that could not be read
+        self._queue = Queue.Queue()
+        self._workers = []
+        gobject.idle_add(prune_copies, priority=gobject.PRIORITY_LOW)
+
+    def load(self, filename, size=None, aspect=None):
+        """
+        Return the image `filename` scaled to `size` with `aspect` (see
+        `exposong.theme.scale_image`), or None if it could not be read or is
+        still being read.
+
+        If `size` is None, the original image is returned.
+        """
+        try:
+            mtime = os.stat(filename).st_mtime
+        except OSError:
+            exposong.log.error('Could not find "%s".', filename)
+            return None
+        if size is not None:
+            size = tuple(int(s) for s in size)
+        key = (filename, mtime, size, aspect)
+        if key in self._failed:
+            return None
+        pb = self.get(key)
+        if pb is None:
+            original = self.get(key[:2] + (None, None))
+            if self.threaded:
+                self._request(key, original)
+                self.misses += 1
+                return None
+            started = exposong.timing.start()
+            try:
+                original, pb = _read(key, original)
+            except Exception, details:
+                self._failed.add(key)
+                exposong.log.error('Could not read "%s":\n  %s', filename,
+                                   details)
+                return None
+            exposong.timing.stop('image load', started)
+            self._store(key, original, pb)
+        return pb
+
+    def _request(self, key, original):
+        "Queue an image to be read by a worker thread."
+        if key in self._pending:
+            return
+        self._pending.add(key)
+        if not self._workers:
+            for i in range(WORKERS):
+                worker = threading.Thread(target=self._work,
+                                          name="imagecache-%d" % i)
+                worker.setDaemon(True)
+                worker.start()
+                self._workers.append(worker)
+        self._queue.put((key, original))
+
+    def _work(self):
+        "Read the queued images. This runs in a worker thread."
+        while True:
+            key, original = self._queue.get()
+            started = exposong.timing.start()
+            error = None
+            try:
+                original, pb = _read(key, original)
+            except Exception, details:
+                # Any error, so that the worker keeps running.
+                original = pb = None
+                error = details
+            exposong.timing.stop('image load', started)
+            gobject.idle_add(self._on_loaded, key, original, pb, error)
+
+    def _on_loaded(self, key, original, pb, error=None):
+        "Store an image read by a worker thread."
+        self._pending.discard(key)
+        if pb is None:
+            # Don't try to read it again until the file changes.
+            self._failed.add(key)
+            exposong.log.error('Could not read "%s":\n  %s', key[0], error)
+        else:
+            self._store(key, original, pb)
+        # Also sent for a failed image, so that a screen waiting for it is
+        # drawn without it.
+        self.emit('image-loaded')
+        return False
+
+    def _store(self, key, original, pb):
+        "Add an image and its original to the cache."
+        if original is not None and key[2] is not None:
+            self.put(key[:2] + (None, None), original)
+        self.put(key, pb)
+
+    def get(self, key):
+        "Return the pixbuf for `key`, or None if it is not cached."
+        pb = self._pixbufs.get(key)
+        if pb is not None:
+            self._order.remove(key)
+            self._order.append(key)
+        return pb
+
+    def put(self, key, pb):
+        "Add a pixbuf to the cache."
+        if key in self._pixbufs:
+            self.remove(key)
+        self._pixbufs[key] = pb
+        self._order.append(key)
+        self._bytes += _pixbuf_bytes(pb)
+        while self._bytes > self.max_bytes and len(self._order) > 1:
+            self.remove(self._order[0])
+
+    def remove(self, key):
+        "Remove a pixbuf from the cache."
+        pb = self._pixbufs.pop(key, None)
+        if pb is not None:
+            self._order.remove(key)
+            self._bytes -= _pixbuf_bytes(pb)
+
+    def invalidate(self, filename=None):
+        """
+        Remove the pixbufs of `filename`, or all pixbufs if it is None. The
+        reduced copies of `filename` are removed from the disk.
+        """
+        if filename is None:
+            exposong.log.debug("Clearing the image cache.")
+            self._failed.clear()
+            self._pixbufs = {}
+            self._order = []
+            self._bytes = 0
+            return
+        for key in self._order[:]:
+            if key[0] == filename:
+                self.remove(key)
+        for key in list(self._failed):
+            if key[0] == filename:
+                self._failed.discard(key)
+        remove_copies(filename)
+
+    def __len__(self):
+        return len(self._pixbufs)
+
+
+def _read(key, original=None):
+    """
+    Return the original and the scaled image for `key`.
+    
+    The original is None if only a smaller copy of the image was read.
+    """
+    filename, mtime, size, aspect = key
+    if size is None:
+        original = gtk.gdk.pixbuf_new_from_file(filename)
+        return original, original
+    if original is None:
+        pb, original = _read_reduced(filename, size, aspect, mtime)
+    else:
+        pb = original
+    return original, exposong.theme.scale_image(pb, size, aspect)
+
+def read_at_size(filename, size, aspect=None, mtime=None):
+    """
+    Read an image at about the size it will be scaled to, or at its own size
+    if it is smaller.
+    
+    The image is reduced by a power of two, so that the copy saved on the disk
+    can be used for similar sizes. This can be called from any thread.
+    """
+    return _read_reduced(filename, size, aspect, mtime)[0]
+
+def _read_reduced(filename, size, aspect=None, mtime=None):
+    """
+    Return the image read by `read_at_size`, and the same pixbuf again if it
+    is the whole image, or None if it was reduced.
+    """
+    if mtime is None:
+        mtime = os.stat(filename).st_mtime
+    info = gtk.gdk.pixbuf_get_file_info(filename)
+    if info is None:
+        pb = gtk.gdk.pixbuf_new_from_file(filename)
+        return pb, pb
+    width, height = info[1:3]
+    scale_w = float(size[0]) / width
+    scale_h = float(size[1]) / height
+    if aspect == exposong.theme.ASPECT_FIT:
+        scale = min(scale_w, scale_h)
+    else:
+        scale = max(scale_w, scale_h)
+    factor = 1
+    while factor * 2 * scale <= 1.0:
+        factor *= 2
+    if factor == 1:
+        pb = gtk.gdk.pixbuf_new_from_file(filename)
+        return pb, pb
+    w = int(math.ceil(float(width) / factor))
+    h = int(math.ceil(float(height) / factor))
+    
+    prefix = _copy_prefix(filename)
+    version = hashlib.md5(repr(mtime)).hexdigest()[:8]
+    name = "%s-%s-%dx%d" % (prefix, version, w, h)
+    for ext in (".jpg", ".png"):
+        if os.path.isfile(name + ext):
+            try:
+                pb = gtk.gdk.pixbuf_new_from_file(name + ext)
+                # Mark it as recently used for `prune_copies`.
+                os.utime(name + ext, None)
+                return pb, None
+            except (OSError, gobject.GError):
+                pass
+    pb = gtk.gdk.pixbuf_new_from_file_at_scale(filename, w, h, False)
+    _save_copy(pb, name)
+    # Copies of older versions of the file are not needed anymore.
+    for fl in glob.glob(prefix + "-*"):
+        if not fl.startswith("%s-%s-" % (prefix, version)):
+            _remove_copy(fl)
+    return pb, None
+
+def _copy_prefix(filename):
+    "Return the path of the reduced copies of `filename`, without the end."
+    return os.path.join(DATA_PATH, ".cache", "images",
+                        hashlib.md5(repr(filename)).hexdigest())
+
+def _save_copy(pb, name):
+    "Save a scaled copy of an image to the disk cache."
+    # This runs in worker threads, so errors are not logged. The copy is
+    # only needed to read the image faster.
+    try:
+        directory = os.path.dirname(name)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if pb.get_has_alpha():
+            pb.save(name + ".png.new", "png")
+            os.rename(name + ".png.new", name + ".png")
+        else:
+            pb.save(name + ".jpg.new", "jpeg", {"quality": "95"})
+            os.rename(name + ".jpg.new", name + ".jpg")
+    except (OSError, gobject.GError):
+        pass
+
+def _remove_copy(filename):
+    "Remove a reduced copy of an image, if it exists."
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+def remove_copies(filename):
+    "Remove the reduced copies of the image `filename` from the disk."
+    for fl in glob.glob(_copy_prefix(filename) + "-*"):
+        _remove_copy(fl)
+
+def prune_copies(max_bytes=COPY_BYTES):
+    """
+    Remove the least recently used reduced copies of images until they use
+    less than `max_bytes` of disk space.
+    """
+    copies = []
+    total = 0
+    for fl in glob.glob(os.path.join(DATA_PATH, ".cache", "images", "*")):
+        try:
+            stat = os.stat(fl)
+        except OSError:
+            continue
+        copies.append((stat.st_mtime, stat.st_size, fl))
+        total += stat.st_size
+    if total > max_bytes:
+        exposong.log.debug("Removing old copies of images.")
+    copies.sort()
+    for mtime, size, fl in copies:
+        if total <= max_bytes:
+            break
+        _remove_copy(fl)
+        total -= size
+    return False
+
+def _pixbuf_bytes(pb):
+    "Return the memory used by a pixbuf."
+    return pb.get_rowstride() * pb.get_height()
@@ -0,0 +1,182 @@
+#
+# vim: ts=4 sw=4 expandtab ai:
+#
+# Copyright (C) 2008-2011 Exposong.org
+#
+# ExpoSong is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The library index keeps the information needed to list a presentation in the
+library, so that the presentation files do not have to be read at startup.
+
+Each entry is stored by filename with the modification time, size and a hash of
+the file contents. An entry is only used if the file has not changed since it
+was indexed. Files that are not presentations are stored with a type of None,
+so that they are not read again.
+"""
+
+import cPickle as pickle
+import hashlib
+import os
+import os.path
+import shutil
+
+import exposong
+from exposong import DATA_PATH
+
+# Increase this when the format of the entries changes.
+INDEX_VERSION = 4
+
+index = None # will hold the LibraryIndex instance
+
+
+class LibraryIndex(object):
+    """
+    An on-disk index of the presentations in DATA_PATH/pres.
+    """
+    def __init__(self, filename=None):
+        if filename is None:
+            filename = os.path.join(DATA_PATH, ".cache", "library.idx")
+        self.filename = filename
+        self._entries = {}
+        self._changed = False
+        self.load()
+
+    def load(self):
+        "Read the index from disk."
+        if not os.path.isfile(self.filename):
+            return
+        try:
+            fl = open(self.filename, 'rb')
+            try:
+                data = pickle.load(fl)
+            finally:
+                fl.close()
+        except Exception, details:
+            exposong.log.warning('Could not read the library index "%s":\n  %s',
+                                 self.filename, details)
+            return
+        if data.get('version') != INDEX_VERSION:
+            exposong.log.info('Rebuilding the library index.')
+            return
+        self._entries = data['entries']
+        exposong.log.debug('Read %d entries from the library index.',
+                           len(self._entries))
+
+    def save(self):
+        "Write the index to disk if it has changed."
+        if not self._changed:
+            return
+        directory = os.path.dirname(self.filename)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        tmpname = self.filename + ".new"
+        try:
+            fl = open(tmpname, 'wb')
+            try:
+                pickle.dump({'version': INDEX_VERSION,
+                             'entries': self._entries},
+                            fl, pickle.HIGHEST_PROTOCOL)
+            finally:
+                fl.close()
+            shutil.move(tmpname, self.filename)
+        except (IOError, OSError), details:
+            exposong.log.error('Could not save the library index "%s":\n  %s',
+                               self.filename, details)
+            return
+        exposong.log.debug('Saved %d entries to the library index.',
+                           len(self._entries))
+        self._changed = False
+
+    def lookup(self, filename):
+        "Return the entry for `filename`, or None if it is missing or outdated."
+        entry = self._entries.get(os.path.basename(filename))
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        if entry['size'] != stat.st_size:
+            return None
+        if entry['mtime'] != stat.st_mtime:
+            # The file was touched, but may still have the same contents.
+            if entry['hash'] != file_hash(filename):
+                return None
+            entry['mtime'] = stat.st_mtime
+            self._changed = True
+        return entry
+
+    def update(self, pres):
+        "Store the header of the presentation `pres`."
+        entry = make_entry(pres)
+        if entry is not None:
+            self.set(pres.filename, entry)
+
+    def set(self, filename, entry):
+        "Store an entry from `make_entry()` for `filename`."
+        self._entries[os.path.basename(filename)] = entry
+        self._changed = True
+
+    def remove(self, filename):
+        "Remove the entry for `filename`."
+        if self._entries.pop(os.path.basename(filename), None) is not None:
+            self._changed = True
+
+    def prune(self, filenames):
+        "Remove all entries that are not in `filenames`."
+        keep = set(os.path.basename(fl) for fl in filenames)
+        for key in self._entries.keys():
+            if key not in keep:
+                del self._entries[key]
+                self._changed = True
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def make_entry(pres):
+    """
+    Return the index entry of the presentation `pres`, or None if it has no
+    file.
+    """
+    if not pres.filename or not os.path.isfile(pres.filename):
+        return None
+    entry = make_file_entry(pres.filename)
+    entry['type'] = pres.get_type()
+    entry['header'] = pres.get_header()
+    return entry
+
+def make_file_entry(filename):
+    """
+    Return the index entry of a file that is not a presentation. Its type and
+    header are None.
+    """
+    stat = os.stat(filename)
+    return {'type': None,
+            'header': None,
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'hash': file_hash(filename)}
+
+def file_hash(filename):
+    "Return a hash of the contents of `filename`."
+    md5 = hashlib.md5()
+    fl = open(filename, 'rb')
+    try:
+        for chunk in iter(lambda: fl.read(65536), ''):
+            md5.update(chunk)
+    finally:
+        fl.close()
+    return md5.hexdigest()
@@ -19,9 +19,12 @@
 import gtk
 import gtk.gdk
 import gobject
+import multiprocessing
 import operator
 import os
 import os.path
+import Queue
+import sys
 import time
 from gtk.gdk import pixbuf_new_from_file as pb_new
 from xml.etree import cElementTree as etree
@@ -32,20 +35,37 @@ import exposong.plugins._abstract
 import exposong.notify
 import exposong._hook
 import exposong.help
+import exposong.libindex
+import exposong.timing
 from exposong import RESOURCE_PATH, DATA_PATH
 from exposong import config, prefs, screen, schedlist, splash
-from exposong import preslist, presfilter, slidelist, statusbar, themeselect
+from exposong import imagecache, preslist, presfilter, slidecache, slidelist
+from exposong import statusbar
+from exposong import themeselect
 from exposong import print_support
 from exposong.schedule import Schedule # ? where to put library
+import presheader
 
 main = None
 keys_to_disable = ("Black Screen",)
 
+# Songs missing from the library index are read by other processes if there
+# are at least PARSE_MIN_FILES presentations to read.
+PARSE_MIN_FILES = 20
+PARSE_PROCESSES = 4
+# The presentations added to the library between main loop iterations.
+PARSE_BATCH = 50
+# The seconds to wait for a read song before letting the main loop run.
+PARSE_WAIT = 0.01
+
 
 class Main (gtk.Window):
     '''
     Primary user interface.
     '''
+    # The presentations read by build_pres_list, until they are added to the
+    # library.
+    _loading = None
 
     def __init__(self):
         # Define this instance in the global scope. This has to be done
@@ -77,6 +97,8 @@ class Main (gtk.Window):
         
         #These have to be initialized for the menus to render properly
         exposong.log.debug("Loading the presentation screen.")
+        slidecache.cache = slidecache.SlideCache()
+        imagecache.cache = imagecache.ImageCache()
         screen.screen = screen.Screen()
         screen.screen.reposition(self)
         
@@ -360,50 +382,174 @@ class Main (gtk.Window):
     def load_pres(self, filenm):
         'Load a single presentation.'
         filenm = os.path.join(DATA_PATH, "pres", filenm)
-        pres = None
-        
-        # TODO Might need to attempt to read the file first, then convert if
-        # reading it fails.
+        # Use the library index if the file has not changed since it was read.
+        if self._load_indexed(filenm):
+            return
+        self._convert_pres(filenm)
+        self._load_file(filenm, False)
+    
+    def _load_indexed(self, filenm):
+        'Load a presentation from the library index, if it is indexed.'
+        entry = exposong.libindex.index.lookup(filenm)
+        if entry is None:
+            return False
+        if entry['type'] is None:
+            # Not a presentation, and not changed since it was read.
+            return True
+        return self._add_entry(filenm, entry)
+    
+    def _add_entry(self, filenm, entry):
+        'Add a presentation to the library from its library index entry.'
+        plugins = exposong.plugins.get_plugins_by_capability(
+                exposong.plugins._abstract.Presentation)
+        for plugin in plugins:
+            if plugin.get_type() == entry['type']:
+                pres = plugin(filenm, entry['header'])
+                self._add_to_library(pres)
+                presfilter.index.add(pres)
+                return True
+        return False
+    
+    def _add_to_library(self, pres):
+        'Add a presentation to the library, or to the list being loaded.'
+        if self._loading is not None:
+            self._loading.append(pres)
+        else:
+            self.library.append(pres)
+    
+    def _convert_pres(self, filenm):
+        'Convert a presentation from an old format. Return True if converted.'
+        converted = False
         plugins = exposong.plugins.get_plugins_by_capability(
                 exposong.plugins._abstract.ConvertPresentation)
         for plugin in plugins:
             if plugin.is_type(filenm):
                 exposong.log.info('Converting "%s" to openlyrics.', filenm)
                 plugin.convert(filenm)
-        
+                converted = True
+        return converted
+    
+    def _load_file(self, filenm, convert=True):
+        """
+        Read a presentation file and add it to the library.
+        
+        If `convert` is True and no plugin can read the file, it is converted
+        from an old format if possible.
+        """
+        failed = False
         plugins = exposong.plugins.get_plugins_by_capability(
                 exposong.plugins._abstract.Presentation)
         for plugin in plugins:
             try:
                 pres = plugin(filenm)
-                self.library.append(pres)
+                self._add_to_library(pres)
+                exposong.libindex.index.update(pres)
+                presfilter.index.add(pres)
+                # Only keep the header until the presentation is opened.
+                pres.unload()
                 exposong.log.info('Adding %s presentation "%s" to Library.',
                                   pres.get_type(), os.path.basename(filenm))
                 break
             except exposong.plugins._abstract.WrongPresentationType, details:
                 continue
             except Exception, details:
+                failed = True
                 exposong.log.error('Could not load presentation "%s":\n  %s',
                                    filenm, details)
         else:
-            exposong.log.warning('"%s" is not a presentation file.', filenm)
-        
+            if convert and self._convert_pres(filenm):
+                self._load_file(filenm, False)
+            else:
+                self._not_pres(filenm, failed)
+    
+    def _not_pres(self, filenm, failed):
+        'Warn about a file that is not a presentation.'
+        exposong.log.warning('"%s" is not a presentation file.', filenm)
+        if not failed:
+            # Don't read it again until it changes.
+            exposong.libindex.index.set(filenm,
+                    exposong.libindex.make_file_entry(filenm))
+    
+    def _load_parallel(self, reader):
+        """
+        Add the songs read by `reader`, a `presheader.HeaderReader`, to the
+        library in batches as they are read. Other files are read here.
+        """
+        count = 0
+        while True:
+            try:
+                filenm, header = reader.get(PARSE_WAIT)
+            except Queue.Empty:
+                yield True
+                continue
+            except StopIteration:
+                return
+            entry = None
+            if header is not None:
+                entry = exposong.libindex.make_file_entry(filenm)
+                entry['type'] = exposong.plugins.lyric.Presentation.get_type()
+                entry['header'] = header
+            if entry is not None and self._add_entry(filenm, entry):
+                exposong.libindex.index.set(filenm, entry)
+                exposong.log.info('Adding %s presentation "%s" to Library.',
+                                  entry['type'], os.path.basename(filenm))
+            else:
+                self._load_file(filenm)
+            splash.splash.incr(1)
+            count += 1
+            if count % PARSE_BATCH == 0:
+                yield True
+    
     def build_pres_list(self):
         'Load presentations and add them to self.library.'
         directory = os.path.join(DATA_PATH, "pres")
         dir_list = os.listdir(directory)
         splash.splash.incr_total(len(dir_list))
+        self._loading = []
+        # Files in old formats are converted once, the first time ExpoSong
+        # starts. After that, only files that no plugin can read are checked.
+        migrate = config.config.get("general", "converted-old-formats") != "True"
+        # Presentations that are not in the library index are read after the
+        # indexed ones, in other processes if there are many of them.
+        missing = []
         for filenm in dir_list:
-            if filenm.endswith(".xml"):
-                self.load_pres(filenm)
+            if not filenm.endswith(".xml"):
+                splash.splash.incr(1)
+                continue
+            filenm = os.path.join(directory, filenm)
+            if migrate:
+                self._convert_pres(filenm)
+            if self._load_indexed(filenm):
+                splash.splash.incr(1)
+            else:
+                missing.append(filenm)
+            yield True
+        if migrate:
+            exposong.log.info("Converted the presentations in old formats.")
+            config.config.set("general", "converted-old-formats", "True")
+        
+        reader = _create_reader(missing)
+        if reader is None:
+            for filenm in missing:
+                self._load_file(filenm)
+                splash.splash.incr(1)
                 yield True
-            splash.splash.incr(1)
+        else:
+            for ret in self._load_parallel(reader):
+                yield ret
+        exposong.libindex.index.prune(dir_list)
+        exposong.libindex.index.save()
         
         # Load modules that hook into LoadPres
         for m in exposong._hook.get_hooks(exposong._hook.LoadPres):
             for pres in m.load_presentations():
-                self.library.append(pres)
+                self._add_to_library(pres)
+                presfilter.index.add(pres)
                 yield True
+        
+        # Adding the rows at once sorts the library only once.
+        self.library.append_all(self._loading)
+        self._loading = None
         yield False
     
     def load_sched(self, filenm):
@@ -433,6 +579,8 @@ class Main (gtk.Window):
         #Initialize the Library
         directory = os.path.join(DATA_PATH, "sched")
         self.library = Schedule(_("Library"))
+        exposong.libindex.index = exposong.libindex.LibraryIndex()
+        presfilter.index = presfilter.SearchIndex()
         task = self.build_pres_list()
         gobject.idle_add(task.next, priority=gobject.PRIORITY_DEFAULT_IDLE - 10)
         yield True
@@ -568,11 +716,33 @@ Visit the following URL to download free Songs and Themes:")
     def _quit(self, *args):
         'Cleans up and exits the program.'
         self._save_schedules()
+        exposong.libindex.index.save()
+        if exposong.options.timing_file:
+            exposong.timing.dump(exposong.options.timing_file)
         self.save_state()
         config.config.write()
         gtk.main_quit()
 
 
+def _create_reader(files):
+    """
+    Return a `presheader.HeaderReader` that reads the songs among `files`, or
+    None if they should be read in this process.
+    """
+    # In frozen builds, sys.executable is ExpoSong and not Python.
+    if len(files) < PARSE_MIN_FILES or hasattr(sys, "frozen"):
+        return None
+    try:
+        processes = min(multiprocessing.cpu_count(), PARSE_PROCESSES)
+    except NotImplementedError:
+        return None
+    if processes < 2:
+        return None
+    return presheader.HeaderReader(files,
+            dict(exposong.plugins.lyric.verse_names), processes)
+
 def run():
+    # Images are read in worker threads (see exposong.imagecache).
+    gobject.threads_init()
     Main()
     gtk.main()
@@ -18,14 +18,17 @@
 
 import gtk
 import gtk.gdk
+import os.path
 import re
 from xml.etree import cElementTree as etree
 
 from exposong.glob import *
 from exposong import theme
+import exposong.libindex
 import exposong.main
 import exposong.schedlist
 import exposong.presfilter
+import presheader
 
 '''
 Abstract classes that create plugin functionality.
@@ -129,6 +132,11 @@ class Presentation:
                     self.id = random_string(8)
     
     filename = None
+    # Set when the presentation was created from the library index. The
+    # attributes in `_lazy_attrs` are read from the file on first access.
+    _header = None
+    _lazy_attrs = ('slides',)
+    _body_sizes = None
     
     def __init__(self, filename=''):
         self._title = ''
@@ -136,6 +144,57 @@ class Presentation:
         if self.__class__ is Presentation:
             raise NotImplementedError("This class cannot be instantiated.")
     
+    def __getattr__(self, name):
+        'Read the presentation from disk the first time its contents are used.'
+        if name in self._lazy_attrs and self._header is not None:
+            self.load()
+            return getattr(self, name)
+        raise AttributeError(name)
+    
+    def is_loaded(self):
+        'Return True if the presentation contents have been read.'
+        return self._header is None
+    
+    def load(self):
+        'Read the presentation contents from disk.'
+        exposong.log.debug('Reading %s presentation "%s".', self.get_type(),
+                           os.path.basename(self.filename))
+        self._header = None
+        self._load()
+    
+    def _load(self):
+        'Read the presentation from `self.filename`.'
+        raise NotImplementedError
+    
+    def unload(self):
+        'Free the presentation contents, keeping only the header.'
+        if not self.filename or self._header is not None:
+            return
+        self._header = self.get_header()
+        for name in self._lazy_attrs:
+            self.__dict__.pop(name, None)
+    
+    def get_header(self):
+        'Return the information that is stored in the library index.'
+        slides = [(s.title, s.get_title(), s.get_text()) for s in self.slides]
+        titles, info = self._get_search_info()
+        return presheader.make_header(self.get_title(), slides, titles, info)
+    
+    def get_search_fields(self):
+        """
+        Return the words that can be searched for, by field.
+        
+        The keys are the fields in `exposong.presfilter.FIELD_WEIGHTS`, the
+        values are sorted lists of words.
+        """
+        if self._header is not None:
+            return self._header['fields']
+        return self.get_header()['fields']
+    
+    def _get_search_info(self):
+        'Return the other titles and other information that can be searched.'
+        return (), ()
+    
     @classmethod
     def is_type(cls, fl):
         "Test to see if this file is the correct type."
@@ -193,19 +252,30 @@ class Presentation:
         'Gets the slide index.'
         return int(order_value)
 
-    def matches(self, word):
-        'Tests to see if a word is in the presentation.'
-        if exposong.presfilter.matches(word, self.get_title()):
-            exposong.log.debug("Matches presentation title")
-            return True
-        for s in self.slides:
-            if exposong.presfilter.matches(word, s.get_title()):
-                exposong.log.debug("Matches slide title")
-                return True
-            if exposong.presfilter.matches(word, s.get_text()):
-                exposong.log.debug("Matches slide text")
-                return True
-        return False
+    def get_shown_slides(self):
+        'Return every slide that can be shown on the screen.'
+        return self.slides
+    
+    def get_body_size(self, theme, bounds):
+        """
+        Return the font size at which the text of every slide in
+        `get_shown_slides()` fits the body of `theme`.
+        
+        The size is calculated once for each theme, screen size and number of
+        slides, and forgotten when the theme changes.
+        """
+        if self._body_sizes is None:
+            self._body_sizes = {}
+        revision = theme.get_revision()
+        if theme not in self._body_sizes or \
+                self._body_sizes[theme][0] != revision:
+            self._body_sizes[theme] = (revision, {})
+        sizes = self._body_sizes[theme][1]
+        slides = self.get_shown_slides()
+        key = (tuple(bounds), len(slides))
+        if key not in sizes:
+            sizes[key] = theme.get_body_size(bounds, slides)
+        return sizes[key]
     
     def edit(self):
         'Run the edit edit_dialog for the presentation.'
@@ -232,7 +302,10 @@ class Presentation:
             if edit_dialog.run() == gtk.RESPONSE_ACCEPT:
                 if self._is_editing_complete(edit_dialog):
                     self._edit_save()
+                    self._body_sizes = None
                     self.to_xml()
+                    exposong.libindex.index.update(self)
+                    exposong.presfilter.index.update(self)
                     del(self._fields)
                     edit_dialog.destroy()
                     if not self.filename:
@@ -27,7 +27,9 @@ import difflib
 
 from exposong_openlyrics import openlyrics
 
+import exposong.libindex
 import exposong.main
+import exposong.presfilter
 import exposong.schedlist
 import exposong.theme
 from exposong import DATA_PATH
@@ -232,7 +234,7 @@ class ExportImport(Plugin, exposong._hook.Menu):
         songs = "";
         for pres in exposong.main.main.library:
             if pres[0].get_type()=="song":
-                songs += pres[0].song.props.titles[0].text + "\n"
+                songs += pres[0].get_titles()[0].text + "\n"
         
         dlg = gtk.FileChooserDialog(_("Export Alphabetical Song List"),
             exposong.main.main, gtk.FILE_CHOOSER_ACTION_SAVE,
@@ -295,9 +297,9 @@ class ExportImport(Plugin, exposong._hook.Menu):
         while itr:
             pres = library.get_value(itr, 0)
             if pres.get_type() == "song":
-                cur_title_sim = cls.get_similarity([x.text for x in pres.song.props.titles],
+                cur_title_sim = cls.get_similarity([x.text for x in pres.get_titles()],
                                                    [x.text for x in new_song.props.titles])
-                cur_author_sim = cls.get_similarity([x.name for x in pres.song.props.authors],
+                cur_author_sim = cls.get_similarity([x.name for x in pres.get_authors()],
                                                     [x.name for x in new_song.props.authors])
                 
                 if cur_author_sim>max_author_sim and cur_title_sim>max_title_sim:
@@ -335,7 +337,11 @@ class ExportImport(Plugin, exposong._hook.Menu):
         os.remove(existing)
         shutil.copy(new, os.path.join(DATA_PATH, "pres", os.path.basename(new)))
         presrm = exposong.main.main.library.finditer(filename=os.path.basename(existing))
-        if presrm: exposong.main.main.library.remove(presrm)
+        if presrm:
+            item = exposong.main.main.library.get_value(presrm, 0)
+            exposong.presfilter.index.remove(item.presentation)
+            exposong.main.main.library.remove(presrm)
+        exposong.libindex.index.remove(existing)
         exposong.main.main.load_pres(os.path.basename(new))
         #TODO: Remove existing presentation from preslist and schedules
         
@@ -31,6 +31,7 @@ import exposong.main
 import exposong.slidelist
 import exposong._hook
 import exposong_openlyrics.tools.convert_schema as convert_schema
+import presheader
 import undobuffer
 from exposong.glob import *
 from exposong import RESOURCE_PATH, DATA_PATH
@@ -92,18 +93,7 @@ class Presentation (_abstract.Presentation, Plugin, exposong._hook.Menu,
                 self.verse = openlyrics.Verse()
         
         def get_text(self):
-            lineList = []
-            if len(self.verse.lines) > 1:
-                for i in range(max(len(l.lines) for l in self.verse.lines)):
-                    for lines in self.verse.lines:
-                        if i < len(lines.lines):
-                            lineList.append("%s: %s" % (lines.part,
-                                            lines.lines[i]))
-                return '\n'.join(lineList)
-            elif len(self.verse.lines) == 1:
-                return str(self.verse.lines[0])
-            else:
-                return ''
+            return presheader.verse_text(self.verse)
         
         def set_attributes(self, layout):
             'Set attributes on a pango.Layout object.'
@@ -187,24 +177,34 @@ class Presentation (_abstract.Presentation, Plugin, exposong._hook.Menu,
             return "A lyric presentation type."
     
     
-    def __init__(self, filename=''):
+    _lazy_attrs = ('slides', 'song')
+    _title_slide = None
+    
+    def __init__(self, filename='', header=None):
         self.filename = filename
-        self.slides = []
         
-        if filename:
+        if filename and header:
+            # The song is read from the file when it is needed.
+            self._header = header
+        elif filename:
             fl = open(filename, 'r')
             if not self.is_type(fl):
                 fl.close()
                 raise _abstract.WrongPresentationType
             fl.close()
-            
-            self.song = openlyrics.Song(filename)
-            self.update_file_to_latest_version()
-            for v in self.song.verses:
-                self.slides.append(self.Slide(self, v))
+            self._load()
         else:
+            self.slides = []
             self.song = openlyrics.Song()
     
+    def _load(self):
+        'Read the song from `self.filename`.'
+        self.song = openlyrics.Song(self.filename)
+        self.update_file_to_latest_version()
+        self.slides = []
+        for v in self.song.verses:
+            self.slides.append(self.Slide(self, v))
+    
     def update_file_to_latest_version(self):
         'Checks if the OpenLyrics file is at the latest version. If not, update it.'
         song_version = self.song.get_version().split(".")
@@ -218,7 +218,7 @@ class Presentation (_abstract.Presentation, Plugin, exposong._hook.Menu,
             converter.save(self.filename)
             exposong.log.info("Converted File %s to OpenLyrics %s"%(self.filename,
                                                                     convert_schema.TARGET_OPENLYRICS_VER))
-            self.__init__(self.filename)
+            self.song = openlyrics.Song(self.filename)
     
     def get_order_string(self):
         'Return the verse order as a string'
@@ -247,12 +247,22 @@ class Presentation (_abstract.Presentation, Plugin, exposong._hook.Menu,
     
     def get_title_slide(self):
         'Returns a `Slide` with the song title as text'
-        verse = openlyrics.Verse()
-        verse.name = _("Title")
-        slide = self.Slide(self, verse)
-        slide._set_lines(self.get_title())
-        return (slide, slide.get_markup())
+        # The same slide is returned each time, so that it can be cached.
+        if self._title_slide is None:
+            verse = openlyrics.Verse()
+            verse.name = _("Title")
+            slide = self.Slide(self, verse)
+            slide._set_lines(self.get_title())
+            self._title_slide = (slide, slide.get_markup())
+        return self._title_slide
 
+    def get_shown_slides(self):
+        'Return every slide that can be shown, with the title slide if enabled.'
+        slides = list(self.slides)
+        if config.get('songs', 'title_slide') == "True":
+            slides.insert(0, self.get_title_slide()[0])
+        return slides
+    
     def get_order(self, custom_order=True):
         'Returns the order in which the slides should be presented.'
         if len(self.song.props.verse_order) > 0 and custom_order:
@@ -274,36 +284,6 @@ class Presentation (_abstract.Presentation, Plugin, exposong._hook.Menu,
         exposong.log.warning("Slide in order does not exist: %s", order_value)
         return -1
         
-    def matches(self, word):
-        'Tests to see if a word is in the presentation.'
-        if _abstract.Presentation.matches(self, word):
-            return True
-        if exposong.presfilter.matches(word, self.song.props.titles):
-            exposong.log.debug("Matches song title")
-            return True
-        if exposong.presfilter.matches(word, self.song.props.authors):
-            exposong.log.debug("Matches song author")
-            return True
-        if exposong.presfilter.matches(word, self.song.props.songbooks):
-            exposong.log.debug("Matches songbook")
-            return True
-        if exposong.presfilter.matches(word, self.song.props.themes):
-            exposong.log.debug("Matches song theme")
-            return True
-        if exposong.presfilter.matches(word, self.song.props.comments):
-            exposong.log.debug("Matches song comments")
-            return True
-        if exposong.presfilter.matches(word, self.song.props.ccli_no):
-            exposong.log.debug("Matches song ccli_no")
-            return True
-        if exposong.presfilter.matches(word, self.song.props.variant):
-            exposong.log.debug("Matches song variant")
-            return True
-        if exposong.presfilter.matches(word, self.song.props.keywords):
-            exposong.log.debug("Matches song keyword")
-            return True
-        return False
-    
     def _edit_tabs(self, notebook, parent):
         'Run the edit dialog for the presentation.'
         #Title field
@@ -638,6 +618,7 @@ class Presentation (_abstract.Presentation, Plugin, exposong._hook.Menu,
     
     def _edit_save(self):
         'Save the fields if the user clicks ok.'
+        self._title_slide = None
         self.song.props.verse_order = self._fields['verse_order'].get_text().split()
         self.song.props.variant = self._fields['variant'].get_text()
         self.song.props.custom_version = self._fields['custom_version'].get_text()
@@ -803,7 +784,7 @@ class Presentation (_abstract.Presentation, Plugin, exposong._hook.Menu,
         
         authors = [a.name for t in exposong.main.main.library
                      if t[0].get_type() == "song"
-                     for a in t[0].song.props.authors]
+                     for a in t[0].get_authors()]
         authors = sorted(set(authors))
         
         author = gui.append_combo_entry(table, _('Author Name:'),
@@ -861,7 +842,7 @@ class Presentation (_abstract.Presentation, Plugin, exposong._hook.Menu,
             lang_value = model.get_value(itr,1)
         themes = [thm.name for t in exposong.main.main.library
                      if t[0].get_type() == "song"
-                     for thm in t[0].song.props.themes]
+                     for thm in t[0].get_themes()]
         themes = sorted(set(themes))
         theme_ = gui.append_combo_entry(table, _('Theme Name:'),
                                           themes, theme_value, 0)
@@ -908,7 +889,7 @@ class Presentation (_abstract.Presentation, Plugin, exposong._hook.Menu,
             entry_value = model.get_value(itr,1)
         songbooks = [sbook.name for t in exposong.main.main.library
                      if t[0].get_type() == "song"
-                     for sbook in t[0].song.props.songbooks]
+                     for sbook in t[0].get_songbooks()]
         songbooks = sorted(set(songbooks))
         songbook = gui.append_combo_entry(table, _('Songbook Name:'),
                                           songbooks, songbook_value, 0)
@@ -964,6 +945,8 @@ class Presentation (_abstract.Presentation, Plugin, exposong._hook.Menu,
         self.song.write(self.filename)
     
     def get_title(self):
+        if self._header is not None:
+            return self._header['title']
         if len(self.song.props.titles) == 0:
             return os.path.basename(self.filename)
         return str(self.song.props.titles[0])
@@ -1003,6 +986,40 @@ class Presentation (_abstract.Presentation, Plugin, exposong._hook.Menu,
                 order[i] = new_title
         self._fields['verse_order'].set_text(" ".join(order))
 
+    def get_header(self):
+        'Return the information that is stored in the library index.'
+        header = _abstract.Presentation.get_header(self)
+        header.update(presheader.song_header(self.song))
+        return header
+    
+    def _get_search_info(self):
+        'Return the other titles and other information that can be searched.'
+        return presheader.song_info(self.song)
+    
+    def get_titles(self):
+        'Return the titles without reading the song if possible.'
+        if self._header is not None:
+            return [openlyrics.Title(*t) for t in self._header['titles']]
+        return self.song.props.titles
+    
+    def get_themes(self):
+        'Return the song themes without reading the song if possible.'
+        if self._header is not None:
+            return [openlyrics.Theme(*t) for t in self._header['themes']]
+        return self.song.props.themes
+    
+    def get_authors(self):
+        'Return the authors without reading the song if possible.'
+        if self._header is not None:
+            return [openlyrics.Author(*a) for a in self._header['authors']]
+        return self.song.props.authors
+    
+    def get_songbooks(self):
+        'Return the songbooks without reading the song if possible.'
+        if self._header is not None:
+            return [openlyrics.Songbook(*s) for s in self._header['songbooks']]
+        return self.song.props.songbooks
+    
     def get_authors_string(self):
         """"
         Returns a string with the authors of the song.
@@ -1133,7 +1150,7 @@ class Presentation (_abstract.Presentation, Plugin, exposong._hook.Menu,
     def fill_songbook_combo(cls):
         songbooks = [sbook.name for t in exposong.main.main.library
                      if t[0].get_type() == "song"
-                     for sbook in t[0].song.props.songbooks]
+                     for sbook in t[0].get_songbooks()]
         songbooks = sorted(set(songbooks))
         model = cls._songbook_combo.get_model()
         for s in songbooks:
@@ -1147,7 +1164,9 @@ class Presentation (_abstract.Presentation, Plugin, exposong._hook.Menu,
         Opens the Song and returns True, if found. Returns else, if not.'''
         model = exposong.preslist.preslist.get_model()
         for row in model:
-            for sbook in row[0].song.props.songbooks:
+            if row[0].get_type() != "song":
+                continue
+            for sbook in row[0].get_songbooks():
                 if sbook.name.lower() == songbook_combo.get_active_text().lower() and \
                     sbook.entry.lower() == entry.get_text().lower():
                     exposong.preslist.preslist.set_cursor(row.path)
@@ -22,15 +22,19 @@ try:
     import gtkspell
 except Exception:
     pass
+import Queue
 import gobject
 import os, os.path
 import pango
 import re
 import shutil
+import threading
 from xml.etree import cElementTree as etree
 from xml.sax.saxutils import escape, unescape
 
+import exposong.imagecache
 import exposong.main
+import exposong.screen
 import exposong.themeselect
 import exposong._hook
 import undobuffer
@@ -64,42 +68,58 @@ class Presentation (Plugin, _abstract.Presentation, exposong._hook.Menu,
         """
         def __init__(self, pres, value=None):
             self.pres = pres
-            self._content = []
             self.title = ''
             self._theme = None
             if etree.iselement(value):
                 self.title = value.get("title", '')
                 self._theme = value.get("theme", '')
-                for el in value:
-                    k = {}
-                    k['margin'] = el.get('margin', 0)
-                    k['pos'] = [0,0,0,0]
-                    k['pos'][0] = float(el.get('x1', 0.0))
-                    k['pos'][1] = float(el.get('y1', 0.0))
-                    k['pos'][2] = float(el.get('x2', 1.0))
-                    k['pos'][3] = float(el.get('y2', 1.0))
-                    align = theme.get_align_const(el.get('align'))
-                    if align != -1:
-                        k['align'] = align
-                    valign = theme.get_valign_const(el.get('valign'))
-                    if valign != -1:
-                        k['valign'] = valign
-                    if el.tag == 'text':
-                        k['markup'] = unescape(element_contents(el, True))
-                        self._content.append(theme.Text(**k))
-                    elif el.tag == 'image':
-                        if el.get('src'):
-                            k['src'] = os.path.join(IMAGE_PATH, el.get('src'))
-                        else:
-                            k['src'] = ''
-                        k['aspect'] = theme.get_aspect_const(el.get('aspect'),
-                                                             theme.ASPECT_FIT)
-                        
-                        self._content.append(theme.Image(**k))
+                # The content is created when it is first used.
+                self._node = value
+            else:
+                self._content = []
             
             self._set_id(value)
             _abstract.Presentation.Slide.__init__(self, pres, value)
         
+        def __getattr__(self, name):
+            'Create the slide content the first time it is used.'
+            if name == '_content' and '_node' in self.__dict__:
+                self._content = self._parse_content(self.__dict__.pop('_node'))
+                return self._content
+            raise AttributeError(name)
+        
+        @staticmethod
+        def _parse_content(value):
+            'Return the text and image elements of the slide node.'
+            content = []
+            for el in value:
+                k = {}
+                k['margin'] = el.get('margin', 0)
+                k['pos'] = [0,0,0,0]
+                k['pos'][0] = float(el.get('x1', 0.0))
+                k['pos'][1] = float(el.get('y1', 0.0))
+                k['pos'][2] = float(el.get('x2', 1.0))
+                k['pos'][3] = float(el.get('y2', 1.0))
+                align = theme.get_align_const(el.get('align'))
+                if align != -1:
+                    k['align'] = align
+                valign = theme.get_valign_const(el.get('valign'))
+                if valign != -1:
+                    k['valign'] = valign
+                if el.tag == 'text':
+                    k['markup'] = unescape(element_contents(el, True))
+                    content.append(theme.Text(**k))
+                elif el.tag == 'image':
+                    if el.get('src'):
+                        k['src'] = os.path.join(IMAGE_PATH, el.get('src'))
+                    else:
+                        k['src'] = ''
+                    k['aspect'] = theme.get_aspect_const(el.get('aspect'),
+                                                         theme.ASPECT_FIT)
+                    
+                    content.append(theme.Image(**k))
+            return content
+        
         def get_text(self):
             'Returns the contents of text elements for the slide.'
             l = []
@@ -208,44 +228,65 @@ class Presentation (Plugin, _abstract.Presentation, exposong._hook.Menu,
             "Return the description of the plugin."
             return "A lyric presentation type."
     
-    def __init__(self, filename=''):
+    _lazy_attrs = ('slides', '_meta')
+    
+    def __init__(self, filename='', header=None):
         self.filename = filename
-        self._meta = {}
-        self.slides = []
         self._title = ''
         self._timer = None
         self._timer_loop = False
         
-        if filename:
+        if filename and header:
+            # The slides are read from the file when they are needed.
+            self._header = header
+            self._title = header['title']
+            self._timer = header['timer']
+            self._timer_loop = header['timer_loop']
+        elif filename:
             fl = open(filename, 'r')
             if not self.is_type(fl):
                 fl.close()
                 raise _abstract.WrongPresentationType
             fl.close()
-            
-            dom = None
-            try:
-                dom = etree.parse(filename)
-                root = dom.getroot()
-            except IOError, details:
-                exposong.log.error('Could not open presentation "%s": %s',
-                                   filename, details)
-            else:
-                for el in root.find("meta"):
-                    if el.tag == 'title':
-                        self._title = el.text
-                    elif el.tag == 'timer':
-                        self._timer = int(el.get("time"))
-                        self._timer_loop = bool(el.get("loop", False))
-                    else:
-                        self._meta[el.tag] = el.text
-                slides = root.findall("slides/slide")
-                for sl in slides:
-                    self.slides.append(self.Slide(self, sl))
+            self._load()
+        else:
+            self._meta = {}
+            self.slides = []
         
         # TODO Order
         self._order = []
     
+    def _load(self):
+        'Read the presentation from `self.filename`.'
+        self._meta = {}
+        self.slides = []
+        dom = None
+        try:
+            dom = etree.parse(self.filename)
+            root = dom.getroot()
+        except IOError, details:
+            exposong.log.error('Could not open presentation "%s": %s',
+                               self.filename, details)
+        else:
+            for el in root.find("meta"):
+                if el.tag == 'title':
+                    self._title = el.text
+                elif el.tag == 'timer':
+                    self._timer = int(el.get("time"))
+                    self._timer_loop = bool(el.get("loop", False))
+                else:
+                    self._meta[el.tag] = el.text
+            slides = root.findall("slides/slide")
+            for sl in slides:
+                self.slides.append(self.Slide(self, sl))
+    
+    def get_header(self):
+        'Return the information that is stored in the library index.'
+        header = _abstract.Presentation.get_header(self)
+        header['timer'] = self._timer
+        header['timer_loop'] = self._timer_loop
+        return header
+    
     def to_xml(self):
         'Save the data to disk.'
         if self.filename:
@@ -669,8 +710,6 @@ class Presentation (Plugin, _abstract.Presentation, exposong._hook.Menu,
                 gtk.STOCK_ADD, gtk.RESPONSE_ACCEPT) )
         fchooser.set_current_folder(os.path.expanduser("~"))
         fchooser.set_select_multiple(True)
-        progress = gtk.ProgressBar()
-        fchooser.set_extra_widget(progress)
         
         filt = gtk.FileFilter()
         filt.set_name( _("Image Types") )
@@ -681,20 +720,37 @@ class Presentation (Plugin, _abstract.Presentation, exposong._hook.Menu,
         fchooser.connect("update-preview", gui.filechooser_preview, preview)
         if fchooser.run() == gtk.RESPONSE_ACCEPT:
             files = fchooser.get_filenames()
-            for fl in files:
+            fchooser.destroy()
+            dialog = ImageImportDialog(self._fields['title'].get_toplevel(),
+                                       files)
+            for fl, newfile in dialog.run():
                 sl = self.Slide(self)
                 sl.title = _("Image: %s" % os.path.split(fl)[1])
-                sl._content = [theme.Image(fl)]
+                sl._content = [theme.Image(newfile)]
                 sl._set_id()
                 self._fields['slides'].append( (sl, sl.get_markup(True)) )
-                progress.set_fraction(progress.get_fraction() + 1.0/len(files))
-                #It may be better to use generator statements here.
-                #http://faq.pygtk.org/index.py?req=show&file=faq23.020.htp
-                #This makes the progressbar change.
-                while gtk.events_pending():
-                    gtk.main_iteration()
-            
-        fchooser.destroy()
+                self._imported.append(newfile)
+            dialog.destroy()
+        else:
+            fchooser.destroy()
+    
+    def edit(self):
+        """
+        Run the edit dialog. Images that were imported are removed on Cancel,
+        and on Save if no slide shows them any more.
+        """
+        self._imported = []
+        saved = _abstract.Presentation.edit(self)
+        unused = self._imported
+        if saved:
+            used = set(os.path.abspath(c.src) for s in self.slides
+                       for c in s._content
+                       if isinstance(c, theme.Image) and c.src)
+            unused = [fl for fl in unused if os.path.abspath(fl) not in used]
+        for fl in unused:
+            _remove(fl)
+        del self._imported
+        return saved
     
     def on_delete(self):
         "Called when the presentation is deleted."
@@ -1304,3 +1360,134 @@ A value of 0 is on the far left or top, and a value of 1 is on the far right or
         self.changed = False
         return True
 
+
+class ImageImportDialog(gtk.Dialog):
+    """
+    Copies image files to the presentation images folder, showing the
+    progress.
+    
+    The files are copied by worker threads, which also save the scaled copies
+    of the images (see `exposong.imagecache.read_at_size`) for the screen and
+    the slide list.
+    """
+    WORKERS = 2
+    
+    def __init__(self, parent, files):
+        gtk.Dialog.__init__(self, _("Adding Images"), parent,
+                            gtk.DIALOG_MODAL | gtk.DIALOG_DESTROY_WITH_PARENT,
+                            (gtk.STOCK_CANCEL, gtk.RESPONSE_REJECT))
+        self.set_border_width(4)
+        self.set_default_size(350, -1)
+        self._progress = gtk.ProgressBar()
+        self.vbox.pack_start(self._progress, False, True, 6)
+        
+        self._files = files
+        self._imported = [None] * len(files)
+        self._done = 0
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._queue = Queue.Queue()
+        for job in enumerate(files):
+            self._queue.put(job)
+        
+        self._sizes = [(int(exposong.themeselect.SCALED_HEIGHT *
+                            exposong.themeselect.CELL_ASPECT),
+                        exposong.themeselect.SCALED_HEIGHT)]
+        if exposong.screen.screen.get_size():
+            self._sizes.append(exposong.screen.screen.get_size())
+    
+    def run(self):
+        """
+        Import the images. Return a list of (file, imported file) for the
+        images that were imported.
+        """
+        if not self._files:
+            return []
+        self._update_progress()
+        self.show_all()
+        if not os.path.isdir(IMAGE_PATH):
+            os.makedirs(IMAGE_PATH)
+        for i in range(min(self.WORKERS, len(self._files))):
+            worker = threading.Thread(target=self._work)
+            worker.setDaemon(True)
+            worker.start()
+        
+        if gtk.Dialog.run(self) != gtk.RESPONSE_ACCEPT:
+            self._cancelled.set()
+            exposong.log.info('Cancelled adding images.')
+            for newfile in self._imported:
+                if newfile:
+                    _remove(newfile)
+            return []
+        
+        failed = [fl for fl, newfile in zip(self._files, self._imported)
+                  if not newfile]
+        if failed:
+            exposong.log.warning('Could not add the images:\n  %s',
+                                 '\n  '.join(failed))
+        return [(fl, newfile) for fl, newfile in zip(self._files, self._imported)
+                if newfile]
+    
+    def _work(self):
+        "Import the queued images. This runs in a worker thread."
+        while not self._cancelled.isSet():
+            try:
+                i, fl = self._queue.get_nowait()
+            except Queue.Empty:
+                return
+            gobject.idle_add(self._on_imported, i, self._import(fl))
+    
+    def _import(self, fl):
+        "Copy an image and save its scaled copies. Return the new filename."
+        if gtk.gdk.pixbuf_get_file_info(fl) is None:
+            return None
+        self._lock.acquire()
+        try:
+            # Create the file, so that other threads use another name.
+            newfile = find_freefile(os.path.join(IMAGE_PATH,
+                                                 os.path.basename(fl)))
+            open(newfile, 'wb').close()
+        finally:
+            self._lock.release()
+        try:
+            shutil.copyfile(fl, newfile)
+            for size in self._sizes:
+                if self._cancelled.isSet():
+                    break
+                exposong.imagecache.read_at_size(newfile, size, theme.ASPECT_FIT)
+        except (IOError, OSError, gobject.GError):
+            _remove(newfile)
+            return None
+        if self._cancelled.isSet():
+            _remove(newfile)
+            return None
+        return newfile
+    
+    def _on_imported(self, i, newfile):
+        "Update the progress when an image was imported."
+        if self._cancelled.isSet():
+            # The dialog was closed before this image was imported.
+            if newfile:
+                _remove(newfile)
+            return False
+        self._imported[i] = newfile
+        self._done += 1
+        self._update_progress()
+        if self._done == len(self._files):
+            self.response(gtk.RESPONSE_ACCEPT)
+        return False
+    
+    def _update_progress(self):
+        "Show the number of images that were imported."
+        self._progress.set_fraction(float(self._done) / len(self._files))
+        self._progress.set_text(_("%(done)d of %(total)d images") %
+                                {'done': self._done, 'total': len(self._files)})
+
+
+def _remove(filename):
+    "Remove a file and its reduced copies, if it exists."
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+    exposong.imagecache.remove_copies(filename)
@@ -23,6 +23,7 @@ from exposong import gui
 from exposong import DATA_PATH
 from exposong.config import config
 import exposong.screen
+import exposong.slidecache
 import exposong.main
 
 '''
@@ -74,7 +75,7 @@ themes are stored.")
         notebook.append_page(table, gtk.Label( _("General") ))
         
         #Screen Page
-        table = gui.ESTable(9, auto_inc_y=True)
+        table = gui.ESTable(14, auto_inc_y=True)
         
         table.attach_section_title(_("Logo"))
         p_logo = table.attach_filechooser(config.get("screen","logo"),
@@ -114,6 +115,26 @@ themes are stored.")
         except IndexError:
             pass
         
+        table.attach_section_title(_("Text"))
+        p_uniform = table.attach_checkbutton(
+            _("Use the same font size on all slides of a presentation"))
+        if config.get("screen", "uniform_font") == "True":
+            p_uniform.set_active(True)
+        
+        table.attach_section_title(_("Transition"))
+        transition_name = (_("None"), _("Fade"), _("Slide"), _("Dissolve"))
+        try:
+            transition = transition_name[exposong.screen.TRANSITIONS.index(
+                    config.get("screen", "transition"))]
+        except ValueError:
+            transition = transition_name[0]
+        p_transition = table.attach_combo(transition_name, transition,
+                                          label=_("Transition"))
+        adjust = gtk.Adjustment(config.getint("screen", "transition_time"),
+                                0, 5000, 50, 250)
+        p_transition_time = table.attach_spinner(adjust,
+                                                 label=_("Duration (ms)"))
+        
         table.attach_section_title(_("Position"))
         p_monitor = table.attach_combo(monitor_name, sel, label=_("Monitor"))
         
@@ -135,6 +156,9 @@ themes are stored.")
             
             if config.get("songs", "title_slide") != str(g_title.get_active()):
                 config.set("songs", "title_slide", str(g_title.get_active()))
+                if config.get("screen", "uniform_font") == "True":
+                    # The title slide changes the font size of the songs.
+                    exposong.slidecache.cache.invalidate()
                 exposong.slidelist.slidelist.update()
             config.set("songs", "ccli", g_ccli.get_text())
             config.set("updates", "check_for_updates", str(g_update.get_active()))
@@ -148,6 +172,15 @@ themes are stored.")
             ntfb = p_notify_bg.get_color()
             config.setcolor("screen", "notify_bg", (ntfb.red, ntfb.green, ntfb.blue))
             
+            if config.get("screen", "uniform_font") != str(p_uniform.get_active()):
+                config.set("screen", "uniform_font", str(p_uniform.get_active()))
+                exposong.slidecache.cache.invalidate()
+            
+            config.set("screen", "transition",
+                       exposong.screen.TRANSITIONS[p_transition.get_active()])
+            config.set("screen", "transition_time",
+                       str(p_transition_time.get_value_as_int()))
+            
             config.set('screen','monitor', monitor_value[p_monitor.get_active()])
             exposong.screen.screen.reposition(parent)
             
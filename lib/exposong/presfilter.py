@@ -28,15 +28,21 @@
 The PresFilter class will allow the user to search the presentations by text.
 """
 
+import bisect
 import gtk
 import gobject
-import re
 
 import exposong.main
 import exposong.preslist
+from presheader import tokenize
 
 presfilter = None # will hold PresFilter instance
-blacklist = "[.,'?!]" # [ and ] are part of the regex
+index = None # will hold the SearchIndex instance
+
+# The search score of a word found in each field of a presentation.
+FIELD_WEIGHTS = {'title': 8, 'first-line': 4, 'text': 2, 'info': 1}
+# The index words, presentations or list rows handled in one step of a search.
+SEARCH_CHUNK = 500
 
 class PresFilter(gtk.Entry, exposong._hook.Menu):
     """
@@ -83,7 +89,13 @@ class PresFilter(gtk.Entry, exposong._hook.Menu):
 
         # data
         self._timeout_id = 0
-        self.__fmodel = None
+        self.__fmodel = None # Rows matching the search
+        self.__smodel = None # The matching rows sorted by score
+        self._matches = None
+        self._query = ""
+        self._revision = None # The index and revision the matches are from
+        self._search_id = 0
+        self._partial = False # The rows were not all updated for the matches
 
     def _on_icon_pressed(self, widget, icon, mouse_button):
         """
@@ -118,6 +130,7 @@ class PresFilter(gtk.Entry, exposong._hook.Menu):
 
     def _emit_terms_changed(self):
         "Sends the 'terms-changed' signal"
+        self._timeout_id = 0
         text = self.get_text()
         self.emit("terms-changed", text)
 
@@ -127,6 +140,7 @@ class PresFilter(gtk.Entry, exposong._hook.Menu):
         to enter a longer search term
         """
         self._check_style()
+        self._cancel_search()
         if self._timeout_id > 0:
             gobject.source_remove(self._timeout_id)
         self._timeout_id = gobject.timeout_add(self.SEARCH_TIMEOUT,
@@ -153,34 +167,147 @@ class PresFilter(gtk.Entry, exposong._hook.Menu):
             self.modify_text(gtk.STATE_NORMAL, black)
             
     def filter(self, *args):
-        'Filters preslist by the keywords.'
+        'Filters preslist by the keywords, best matches first.'
         preslist = exposong.preslist.preslist
+        self._cancel_search()
+        model = preslist.get_model()
+        if model is not None and model == self.__smodel:
+            model = self.__fmodel.get_model()
+        elif self.__fmodel is not None and self.__fmodel.get_model() != model:
+            # Another schedule was selected. The matches are kept, because
+            # they are the same for every schedule.
+            self.__fmodel = self.__smodel = None
+        
         if self.get_text() == "":
-            if preslist.get_model() == self.__fmodel:
-                preslist.set_model(preslist.get_model().get_model())
-            self.__fmodel = None
+            if preslist.get_model() == self.__smodel:
+                preslist.set_model(model)
+            self._matches = None
+            self._query = ""
+            return
+        
+        task = self._search(self.get_text(), model)
+        self._search_id = gobject.idle_add(task.next)
+    
+    def _cancel_search(self):
+        'Stop a search that has not finished.'
+        if self._search_id > 0:
+            gobject.source_remove(self._search_id)
+            self._search_id = 0
+    
+    def _search(self, text, model):
+        """
+        Find the matching presentations, then update the list. The work is
+        done a part at a time, so that typing can cancel it.
+        
+        The previous matches are used again if the words are the same and the
+        index has not changed. If the search narrows the previous one, only the
+        previous matches can match, and only the rows shown are tested again.
+        """
+        words = tokenize(text)
+        old_words = tokenize(self._query)
+        revision = index.get_revision()
+        narrowing = False
+        if self._matches is None or self._revision != revision:
+            steps = index.search_steps(text)
+        elif words == old_words:
+            steps = [self._matches]
+        elif words and old_words and \
+                all(any(w.startswith(o) for w in words) for o in old_words):
+            steps = index.search_steps(text, self._matches)
+            narrowing = True
         else:
-            if preslist.get_model() == self.__fmodel:
-                self.__fmodel = preslist.get_model().get_model().filter_new()
-            else:
-                self.__fmodel = preslist.get_model().filter_new()
+            steps = index.search_steps(text)
+        matches = None
+        for matches in steps:
+            yield True
+        
+        if self.__fmodel is None:
+            # The rows of a new filter are tested when they are first shown.
+            self._set_matches(matches, text, revision)
+            self._partial = False
+            self.__fmodel = model.filter_new()
             self.__fmodel.set_visible_func(self._visible_func)
-            preslist.set_model(self.__fmodel)
-
+            self.__smodel = gtk.TreeModelSort(self.__fmodel)
+            self.__smodel.set_sort_func(0, self._rank_sort)
+            self.__smodel.set_sort_column_id(0, gtk.SORT_ASCENDING)
+        else:
+            fmodel = self.__fmodel
+            # Find the rows that have to be shown or hidden. When narrowing,
+            # only the rows shown can change, unless the last search was
+            # cancelled part way through updating the rows.
+            if narrowing and not self._partial:
+                rows = fmodel
+            else:
+                rows = model
+            size = rows.iter_n_children(None)
+            changed = []
+            for i in xrange(size):
+                itr = rows.iter_nth_child(None, i)
+                if itr is None:
+                    break
+                if rows is fmodel:
+                    path = fmodel.convert_path_to_child_path((i,))
+                    shown = True
+                else:
+                    path = (i,)
+                    shown = fmodel.convert_child_path_to_path(path) is not None
+                if self._is_match(rows.get_value(itr, 0), matches) != shown:
+                    changed.append(gtk.TreeRowReference(model, path))
+                if i % SEARCH_CHUNK == SEARCH_CHUNK - 1:
+                    yield True
+            
+            self._set_matches(matches, text, revision)
+            if rows.iter_n_children(None) != size:
+                # The schedule changed during the search.
+                fmodel.refilter()
+            else:
+                self._partial = True
+                for count, ref in enumerate(changed):
+                    if ref.valid():
+                        path = ref.get_path()
+                        model.row_changed(path, model.get_iter(path))
+                    if count % SEARCH_CHUNK == SEARCH_CHUNK - 1:
+                        yield True
+                self._partial = False
+        
+        self._search_id = 0
+        # Force the sorted model to use the new scores.
+        self.__smodel.set_sort_func(0, self._rank_sort)
+        preslist = exposong.preslist.preslist
+        if preslist.get_model() != self.__smodel:
+            preslist.set_model(self.__smodel)
+        yield False
+    
+    def _set_matches(self, matches, text, revision):
+        'Store the result of a search.'
+        self._matches = matches
+        self._query = text
+        self._revision = revision
+    
+    @staticmethod
+    def _is_match(item, matches):
+        'Return True if the schedule item `item` is shown for `matches`.'
+        if item is None:
+            return False
+        return matches is None or item.presentation in matches
+    
     def _visible_func(self, model, itr):
         'Tests the row for visibility.'
-        global blacklist
-        pres = model.get_value(itr, 0)
-        if pres is not None:
-            for word in re.sub(blacklist, "", self.get_text()).split():
-                exposong.log.debug('Searching for "%s".',
-                                   word)
-                if not pres.matches(word):
-                    exposong.log.debug('"%s" not found in presentation "%s".',
-                                       word, pres.get_title())
-                    return False
-            return True
-        return False
+        return self._is_match(model.get_value(itr, 0), self._matches)
+    
+    def _rank_sort(self, model, iter1, iter2):
+        'Sort by search score, keeping the order of the schedule for ties.'
+        score1 = score2 = 0
+        if self._matches:
+            pres1 = model.get_value(iter1, 0)
+            pres2 = model.get_value(iter2, 0)
+            if pres1 is not None:
+                score1 = self._matches.get(pres1.presentation, 0)
+            if pres2 is not None:
+                score2 = self._matches.get(pres2.presentation, 0)
+        if score1 != score2:
+            return cmp(score2, score1)
+        return cmp(model.get_path(iter1), model.get_path(iter2))
 
     def focus(self, *args):
         'Sets the focus (for a menu action).'
@@ -203,18 +330,139 @@ class PresFilter(gtk.Entry, exposong._hook.Menu):
         # unmerge_menu not implemented, because we will never uninstall this as
         # a module.
 
-def matches(word, element):
-    "Takes an item, and tests it for a matching word."
-    if isinstance(element, (list, tuple)):
-        for item in element:
-            if matches(word, item):
-                return True
-    else:
-        regex = re.compile("\\b"+re.escape(word), re.U|re.I)
-        try:
-            if regex.search(str(element)):
-                return True
-        except:
+class SearchIndex(object):
+    """
+    An inverted index from the words in presentations to the presentations.
+    
+    Each word maps to the presentations containing it, with the weight of the
+    most important field it was found in. The words are kept in sorted order
+    so that the words starting with a search term can be found with a binary
+    search.
+    """
+    def __init__(self):
+        self._pres = {}    # word -> {presentation: weight}
+        self._tokens = {}  # presentation -> {word: weight}
+        self._words = []   # sorted words, None when it needs to be rebuilt
+        self._revision = 0 # increased when a presentation changes
+    
+    def add(self, pres):
+        "Add or update the words of a presentation."
+        if pres in self._tokens:
+            self.remove(pres)
+        weights = {}
+        for field, tokens in pres.get_search_fields().iteritems():
+            weight = FIELD_WEIGHTS[field]
+            for word in tokens:
+                weights[word] = max(weight, weights.get(word, 0))
+        self._tokens[pres] = weights
+        for word, weight in weights.iteritems():
+            if word not in self._pres:
+                self._pres[word] = {}
+                self._words = None
+            self._pres[word][pres] = weight
+        self._revision += 1
+    
+    update = add
+    
+    def remove(self, pres):
+        "Remove a presentation from the index."
+        for word in self._tokens.pop(pres, ()):
+            found = self._pres[word]
+            del found[pres]
+            if not found:
+                del self._pres[word]
+                self._words = None
+        self._revision += 1
+    
+    def get_revision(self):
+        """
+        Return a value that changes when a presentation is added, updated or
+        removed, so that search results can be reused until then.
+        """
+        return (id(self), self._revision)
+    
+    def find_prefix(self, prefix):
+        """
+        Return the presentations with a word starting with `prefix`.
+        
+        The result maps each presentation to a score. Words that are partly
+        matched count for half of their weight.
+        """
+        found = {}
+        for step in self._find_prefix(prefix, found):
             pass
-
-    return False
+        return found
+    
+    def _find_prefix(self, prefix, found):
+        """
+        Add the presentations with a word starting with `prefix` to `found`.
+        
+        Yields after every SEARCH_CHUNK words. The index can change meanwhile,
+        so words that were removed are skipped.
+        """
+        if self._words is None:
+            self._words = sorted(self._pres)
+        words = self._words
+        i = bisect.bisect_left(words, prefix)
+        count = 0
+        while i < len(words) and words[i].startswith(prefix):
+            word = words[i]
+            for pres, weight in self._pres.get(word, {}).iteritems():
+                if word != prefix:
+                    weight = weight / 2.0
+                if weight > found.get(pres, 0):
+                    found[pres] = weight
+            i += 1
+            count += 1
+            if count % SEARCH_CHUNK == 0:
+                yield None
+    
+    def search(self, text, within=None):
+        """
+        Return the presentations containing every word of `text`.
+        
+        The result maps each presentation to its score, the sum of the scores
+        of the search words. Returns None if there are no words to search for.
+        If `within` is given, only presentations in it are returned.
+        """
+        result = None
+        for result in self.search_steps(text, within):
+            pass
+        return result
+    
+    def search_steps(self, text, within=None):
+        """
+        Search like `search()`, a part at a time.
+        
+        Yields None after each search word and every SEARCH_CHUNK index words
+        or presentations. The last item is the result of `search()`.
+        """
+        result = None
+        for word in tokenize(text):
+            exposong.log.debug('Searching for "%s".', word)
+            found = {}
+            for step in self._find_prefix(word, found):
+                yield None
+            if result is None and within is None:
+                result = found
+            else:
+                if result is None:
+                    candidates = within
+                else:
+                    candidates = result
+                narrowed = {}
+                for count, pres in enumerate(candidates):
+                    if pres in found:
+                        narrowed[pres] = found[pres]
+                        if result is not None:
+                            narrowed[pres] += result[pres]
+                    if count % SEARCH_CHUNK == SEARCH_CHUNK - 1:
+                        yield None
+                result = narrowed
+            if not result:
+                break
+            yield None
+        yield result
+    
+    def __len__(self):
+        return len(self._tokens)
@@ -27,6 +27,9 @@ import gobject
 import pango
 
 import exposong._hook
+import exposong.libindex
+import exposong.presfilter
+import exposong.slidecache
 import exposong.slidelist
 import exposong.schedlist
 import exposong.main
@@ -186,6 +189,7 @@ class PresList(gtk.TreeView, exposong._hook.Menu):
         if not field:
             return False
         if field.edit():
+            exposong.slidecache.cache.invalidate()
             exposong.slidelist.slidelist.update()
     
     def _on_drag_get(self, treeview, context, selection, info, timestamp):
@@ -249,6 +253,8 @@ class PresList(gtk.TreeView, exposong._hook.Menu):
             exposong.main.main.library.remove_if(presentation=item.presentation)
             exposong.log.info('Deleting "%s"', item.filename)
             os.remove(os.path.join(DATA_PATH,"pres",item.filename))
+            exposong.libindex.index.remove(item.filename)
+            exposong.presfilter.index.remove(item.presentation)
             self.activate_pres()
             
 
@@ -26,6 +26,9 @@ from exposong import preslist
 from exposong.glob import get_node_text, check_filename
 import exposong.plugins._abstract
 
+# gtk.TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID, which PyGTK does not export.
+UNSORTED_SORT_COLUMN = -2
+
 
 class Schedule:
     '''
@@ -126,6 +129,33 @@ class Schedule:
             sched = ScheduleItem(pres, comment)
         self.get_model(True).append(sched.get_row())
     
+    def append_all(self, presentations):
+        """
+        Add many presentations to the schedule at once.
+        
+        The schedule is sorted once after all rows are added, and the
+        presentation list is detached while they are added.
+        """
+        model = self.get_model(True)
+        column, order = model.get_sort_column_id()
+        if column is not None:
+            model.set_sort_column_id(UNSORTED_SORT_COLUMN, gtk.SORT_ASCENDING)
+        view = preslist.preslist
+        shown = None
+        if view is not None and view.get_model(True) == model:
+            shown = gtk.TreeView.get_model(view)
+            shown.handler_block_by_func(view._on_pres_added)
+            view.set_model(None)
+        try:
+            for pres in presentations:
+                model.append(ScheduleItem(pres, "").get_row())
+        finally:
+            if column is not None:
+                model.set_sort_column_id(column, order)
+            if shown is not None:
+                view.set_model(shown)
+                shown.handler_unblock_by_func(view._on_pres_added)
+    
     def append_action(self, action):
         'Add the selected presentation to the schedule (from a Menu button).'
         model, itr = preslist.preslist.get_selection().get_selected()
@@ -22,14 +22,20 @@ initialize the window and set up a few things, but most of the rendering is
 done by the theme.
 """
 
+import cairo
 import gobject
 import gtk
 import os
+import random
+import time
 
+import exposong.imagecache
 import exposong.main
 import exposong.prefs
+import exposong.slidecache
 import exposong.slidelist
 import exposong.theme
+import exposong.timing
 import exposong.notify
 
 from exposong.config import config
@@ -53,6 +59,16 @@ screen = None
 #This static value determines the height of the preview screen.
 PREV_HEIGHT = 145
 
+# The transitions between two frames, by config value.
+TRANSITIONS = ('none', 'fade', 'slide', 'dissolve')
+# The time in milliseconds between the frames of a transition.
+FRAME_INTERVAL = 1000 / 30
+# The number of blocks of a dissolve transition (columns, rows).
+DISSOLVE_BLOCKS = (32, 24)
+# The milliseconds the previous frame stays on the screen while the images of
+# the next one are read.
+IMAGE_WAIT = 1000
+
 class Screen(exposong._hook.Menu):
     '''
     The presentation screen for ExpoSong.
@@ -67,10 +83,31 @@ class Screen(exposong._hook.Menu):
         self.pres = gtk.DrawingArea()
         self.pres.connect("expose-event", self._expose_screen)
         self.window.add(self.pres)
+        # The presentation window is drawn off-screen into this surface, and
+        # copied to the window with one paint.
+        self._buffer = None
+        self._buffer_size = None
+        self._buffer_changed = True
+        # The next frame is drawn here before it replaces the buffer.
+        self._spare = None
+        # Set while a new frame waits for its images to be read.
+        self._image_wait_start = None
+        self._image_wait_id = 0
+        # The frame shown before the buffer while a transition runs.
+        self._transition_from = None
+        # Set when the next frame should be shown with a transition.
+        self._transition_next = False
+        self._transition_start = 0
+        self._transition_id = 0
+        self._dissolve_order = []
         
         self.preview = gtk.DrawingArea()
         self.preview.connect("expose-event", self._expose_screen)
-        
+        # The downscaled copy of the slide on the screen, and the slide
+        # surface it was made from.
+        self._preview_surface = None
+        self._preview_source = None
+        exposong.imagecache.cache.connect('image-loaded', self._on_image_loaded)
         
         # Themes being used for the preview when black, background or logo  is active
         t = exposong.theme
@@ -149,14 +186,20 @@ class Screen(exposong._hook.Menu):
         "Returns the current aspect ratio (width / height)."
         return self.aspect
     
-    def draw(self):
+    def draw(self, transition=False):
         '''
         Redraw the presentation and preview screens.
         Draw preview only when freeze is active.
+        
+        If `transition` is True, the change is shown with the transition set
+        in the preferences. This is used when the slide or the screen state
+        changes.
         '''
         if self._actions.get_action('Freeze').get_active() or not self.is_viewable():
             self.preview.queue_draw()
         else:
+            self._buffer_changed = True
+            self._transition_next = self._transition_next or transition
             self.pres.queue_draw()
     
     def hide(self, action=None):
@@ -183,6 +226,14 @@ class Screen(exposong._hook.Menu):
         exposong.slidelist.slidelist.grab_focus()
         exposong.slidelist.slidelist.reset_timer()
     
+    def _on_image_loaded(self, imagecache):
+        'Redraw when an image that was being read is ready.'
+        if self._image_wait_id:
+            # Draw the waiting frame again now.
+            gobject.source_remove(self._image_wait_id)
+            self._image_wait_id = 0
+        self.draw()
+    
     def _expose_screen(self, widget, event):
         'Redraw the presentation screen.'
         self._draw(widget)
@@ -221,55 +272,252 @@ class Screen(exposong._hook.Menu):
                 bounds = self.pres.window.get_size()
             elif self._size:
                 bounds = self._size
-            if bounds:
-                width = int(float(PREV_HEIGHT)*bounds[0]/bounds[1])
-                ccontext.scale(float(width)/bounds[0],
-                               float(PREV_HEIGHT)/bounds[1])
         elif widget is self.pres:
-            self.preview.queue_draw()
+            # A frame that waits for images is drawn again when they are
+            # read, or when it has waited long enough.
+            if (self._buffer_changed and not self._image_wait_id) or \
+                    self._buffer_size != tuple(bounds):
+                started = exposong.timing.start()
+                self._draw_buffer(ccontext.get_target(), bounds)
+                exposong.timing.stop('compose', started)
+                self.preview.queue_draw()
+            started = exposong.timing.start()
+            if self._transition_from is not None:
+                self._paint_transition(ccontext, bounds)
+                exposong.timing.stop('transition frame', started)
+            else:
+                ccontext.set_source_surface(self._buffer, 0, 0)
+                ccontext.paint()
+                exposong.timing.stop('blit', started)
+            return True
         
         slide = exposong.slidelist.slidelist.get_active_item()
-        theme = None
-        
-        if slide:
-            theme = slide.get_theme()
-        if theme is None:
-            theme = exposong.themeselect.themeselect.get_active()
-        if theme is None:
-            # Select the first theme if nothing is set as the default.
-            exposong.themeselect.themeselect.set_active(0)
-            theme = exposong.themeselect.themeselect.get_active()
-        
-        if widget is self.pres:
-            if self._actions.get_action('Black Screen').get_active():
-                exposong.theme.Theme.render_color(ccontext, bounds, '#000')
-            elif self._actions.get_action('Logo').get_active():
-                logoclr = gtk.gdk.Color(*config.getcolor('screen', 'logo_bg'))
-                exposong.theme.Theme.render_color(ccontext, bounds, logoclr.to_string())
-                self.__logo_img.draw(ccontext, bounds, None)
-            elif self._actions.get_action('Background').get_active():
-                theme.render(ccontext, bounds, None)
-            else:
-                theme.render(ccontext, bounds, slide)
+        theme = self.get_theme(slide)
         
         # In Preview show the themes defined in __init__ when
         # one of the secondary buttons is active.
         if widget is self.preview:
+            size = self._get_preview_size(bounds)
             if self._actions.get_action('Black Screen').get_active():
-                self._theme_black.render(ccontext, bounds, None)
+                self._paint_slide(ccontext, size, self._theme_black, None)
             elif self._actions.get_action('Background').get_active():
-                self._theme_bg.render(ccontext, bounds, None)
+                self._paint_slide(ccontext, size, self._theme_bg, None)
             elif self._actions.get_action('Logo').get_active():
-                self._theme_logo.render(ccontext, bounds, None)
+                self._paint_slide(ccontext, size, self._theme_logo, None)
             elif self._actions.get_action('Freeze').get_active():
-                self._theme_freeze.render(ccontext, bounds, None)
+                self._paint_slide(ccontext, size, self._theme_freeze, None)
             else:
-                theme.render(ccontext, bounds, slide)
+                self._paint_preview(ccontext, bounds, theme, slide)
+            bounds = size
         
+        # The notification is drawn over the cached slide.
         exposong.notify.notify.draw(ccontext, bounds)
             
         return True
     
+    def _draw_buffer(self, target, bounds):
+        """
+        Draw the presentation window into the back buffer.
+        
+        The new frame is drawn to a spare surface. If an image of it is still
+        being read, the previous frame stays on the screen until the image is
+        ready, for IMAGE_WAIT milliseconds at most.
+        """
+        if self._buffer_size != tuple(bounds):
+            self._buffer = target.create_similar(cairo.CONTENT_COLOR, *bounds)
+            self._buffer_size = tuple(bounds)
+            self._spare = None
+            self._stop_transition()
+            self._stop_image_wait()
+            self._render_frame(self._buffer, bounds)
+            self._transition_next = False
+            self._buffer_changed = False
+            return
+        if self._spare is None:
+            self._spare = target.create_similar(cairo.CONTENT_COLOR, *bounds)
+        misses = exposong.imagecache.cache.misses
+        self._render_frame(self._spare, bounds)
+        if exposong.imagecache.cache.misses != misses and self._wait_images():
+            return
+        self._stop_image_wait()
+        frame = self._spare
+        if self._transition_next and \
+                config.get('screen', 'transition') != 'none':
+            # Keep the frame on the screen, and fade etc. to the new one.
+            self._start_transition(self._buffer)
+            self._spare = None
+        else:
+            self._spare = self._buffer
+        self._buffer = frame
+        self._transition_next = False
+        self._buffer_changed = False
+    
+    def _render_frame(self, surface, bounds):
+        'Draw the presentation window into `surface`.'
+        ccontext = gtk.gdk.CairoContext(cairo.Context(surface))
+        
+        slide = exposong.slidelist.slidelist.get_active_item()
+        theme = self.get_theme(slide)
+        
+        if self._actions.get_action('Black Screen').get_active():
+            exposong.theme.Theme.render_color(ccontext, bounds, '#000')
+        elif self._actions.get_action('Logo').get_active():
+            logoclr = gtk.gdk.Color(*config.getcolor('screen', 'logo_bg'))
+            exposong.theme.Theme.render_color(ccontext, bounds, logoclr.to_string())
+            self.__logo_img.draw(ccontext, bounds, None)
+        elif self._actions.get_action('Background').get_active():
+            self._paint_slide(ccontext, bounds, theme, None)
+        else:
+            self._paint_slide(ccontext, bounds, theme, slide)
+        
+        # The notification is drawn over the cached slide.
+        started = exposong.timing.start()
+        exposong.notify.notify.draw(ccontext, bounds)
+        exposong.timing.stop('notify', started)
+    
+    def _wait_images(self):
+        """
+        Keep the previous frame on the screen while images are read. Returns
+        False if it has been kept for IMAGE_WAIT already.
+        """
+        if self._image_wait_start is None:
+            self._image_wait_start = time.time()
+        waited = int((time.time() - self._image_wait_start) * 1000)
+        if waited >= IMAGE_WAIT:
+            return False
+        if not self._image_wait_id:
+            self._image_wait_id = gobject.timeout_add(IMAGE_WAIT - waited,
+                                                      self._on_image_wait)
+        return True
+    
+    def _on_image_wait(self):
+        'Show the new frame, even though its images have not been read.'
+        self._image_wait_id = 0
+        self.pres.queue_draw()
+        return False
+    
+    def _stop_image_wait(self):
+        'Stop waiting for the images of a new frame.'
+        self._image_wait_start = None
+        if self._image_wait_id:
+            gobject.source_remove(self._image_wait_id)
+            self._image_wait_id = 0
+    
+    def _start_transition(self, surface):
+        'Start a transition from the frame `surface` to the back buffer.'
+        self._transition_from = surface
+        self._transition_start = time.time()
+        if config.get('screen', 'transition') == 'dissolve':
+            self._dissolve_order = [(x, y) for x in range(DISSOLVE_BLOCKS[0])
+                                    for y in range(DISSOLVE_BLOCKS[1])]
+            random.shuffle(self._dissolve_order)
+        if not self._transition_id:
+            self._transition_id = gobject.timeout_add(FRAME_INTERVAL,
+                                                      self._on_transition_frame)
+    
+    def _stop_transition(self):
+        'Show the back buffer without finishing the transition.'
+        self._transition_from = None
+        self._dissolve_order = []
+    
+    def _on_transition_frame(self):
+        'Request the next frame of the transition.'
+        if self._transition_from is None:
+            self._transition_id = 0
+            return False
+        self.pres.queue_draw()
+        return True
+    
+    def _paint_transition(self, ccontext, bounds):
+        """
+        Paint the transition from the previous frame to the back buffer.
+        
+        The progress is taken from the clock, so frames are dropped when
+        drawing is too slow.
+        """
+        duration = config.getint('screen', 'transition_time') / 1000.0
+        if duration > 0:
+            progress = (time.time() - self._transition_start) / duration
+        else:
+            progress = 1.0
+        transition = config.get('screen', 'transition')
+        if progress >= 1.0 or transition not in TRANSITIONS[1:]:
+            self._stop_transition()
+            ccontext.set_source_surface(self._buffer, 0, 0)
+            ccontext.paint()
+            return
+        
+        if transition == 'fade':
+            ccontext.set_source_surface(self._transition_from, 0, 0)
+            ccontext.paint()
+            ccontext.set_source_surface(self._buffer, 0, 0)
+            ccontext.paint_with_alpha(progress)
+        elif transition == 'slide':
+            offset = int(bounds[0] * progress)
+            ccontext.set_source_surface(self._transition_from, -offset, 0)
+            ccontext.paint()
+            ccontext.set_source_surface(self._buffer, bounds[0] - offset, 0)
+            ccontext.paint()
+        elif transition == 'dissolve':
+            ccontext.set_source_surface(self._transition_from, 0, 0)
+            ccontext.paint()
+            w = float(bounds[0]) / DISSOLVE_BLOCKS[0]
+            h = float(bounds[1]) / DISSOLVE_BLOCKS[1]
+            count = int(len(self._dissolve_order) * progress)
+            for x, y in self._dissolve_order[:count]:
+                ccontext.rectangle(x * w, y * h, w, h)
+            ccontext.clip()
+            ccontext.set_source_surface(self._buffer, 0, 0)
+            ccontext.paint()
+    
+    def get_theme(self, slide):
+        "Return the theme used to show `slide`."
+        theme = None
+        if slide:
+            theme = slide.get_theme()
+        if theme is None:
+            theme = exposong.themeselect.themeselect.get_active()
+        if theme is None:
+            # Select the first theme if nothing is set as the default.
+            exposong.themeselect.themeselect.set_active(0)
+            theme = exposong.themeselect.themeselect.get_active()
+        return theme
+    
+    def prerender(self, slide):
+        "Render `slide` into the slide cache before it is shown."
+        if self._size:
+            exposong.slidecache.cache.render(self.get_theme(slide), slide,
+                                             self._size)
+    
+    def _paint_slide(self, ccontext, bounds, theme, slide):
+        'Paint the slide from the slide cache, rendering it if needed.'
+        surface = exposong.slidecache.cache.render(theme, slide, bounds)
+        ccontext.set_source_surface(surface, 0, 0)
+        ccontext.paint()
+    
+    def _paint_preview(self, ccontext, bounds, theme, slide):
+        """
+        Paint a downscaled copy of the slide on the screen. The copy is only
+        made again when the slide was rendered again.
+        """
+        source = exposong.slidecache.cache.render(theme, slide, bounds)
+        if source is not self._preview_source:
+            width, height = self._get_preview_size(bounds)
+            surface = cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+            scontext = cairo.Context(surface)
+            scontext.scale(float(width) / bounds[0], float(height) / bounds[1])
+            scontext.set_source_surface(source, 0, 0)
+            scontext.paint()
+            self._preview_surface = surface
+            self._preview_source = source
+        ccontext.set_source_surface(self._preview_surface, 0, 0)
+        ccontext.paint()
+    
+    @staticmethod
+    def _get_preview_size(bounds):
+        "Return the preview size for a screen of size `bounds`."
+        return (int(float(PREV_HEIGHT) * bounds[0] / bounds[1]), PREV_HEIGHT)
+    
     def _set_menu_items_disabled(self):
         'Disable buttons if the presentation is not shown.'
         enabled = self.is_viewable()
@@ -386,8 +634,8 @@ class Screen(exposong._hook.Menu):
                 nmaction.set_sensitive(False)
             else:
                 nmaction.set_sensitive(True)
-                self.draw()
-        self.draw()
+                self.draw(True)
+        self.draw(True)
     
     def to_logo(self, action=None):
         'Set the screen to the ExpoSong logo or a user-defined one.'
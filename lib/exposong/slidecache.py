@@ -0,0 +1,113 @@
+#
+# vim: ts=4 sw=4 expandtab ai:
+#
+# Copyright (C) 2008-2011 Exposong.org
+#
+# ExpoSong is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The slide cache keeps slides that have been rendered by a theme, so that
+showing a slide again only copies the finished image to the screen.
+
+Surfaces are stored by theme, slide and size. When the cache is larger than
+its byte budget, the least recently used surfaces are removed.
+"""
+
+import cairo
+import gtk.gdk
+
+import exposong
+import exposong.imagecache
+import exposong.timing
+
+# The memory that may be used by rendered slides (about 8 slides at 1080p).
+CACHE_BYTES = 64 * 1024 * 1024
+
+cache = None # will hold the SlideCache instance
+
+
+class SlideCache(object):
+    """
+    A cache of rendered slides, limited by size in bytes.
+    """
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._surfaces = {}
+        self._order = []  # keys, least recently used first
+        self._bytes = 0
+
+    def render(self, theme, slide, bounds):
+        """
+        Return an ImageSurface of `slide` rendered with `theme`.
+
+        If `slide` is None, only the background is rendered.
+        """
+        key = (theme, slide or None, tuple(bounds))
+        surface = self.get(key)
+        if surface is None:
+            surface = cairo.ImageSurface(cairo.FORMAT_RGB24, *key[2])
+            ccontext = gtk.gdk.CairoContext(cairo.Context(surface))
+            misses = exposong.imagecache.cache.misses
+            started = exposong.timing.start()
+            theme.render(ccontext, key[2], slide or None)
+            exposong.timing.stop('render', started)
+            if exposong.imagecache.cache.misses == misses:
+                # Slides with images that are still being read are not kept.
+                self.put(key, surface)
+        return surface
+
+    def get(self, key):
+        "Return the surface for `key`, or None if it is not cached."
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._order.remove(key)
+            self._order.append(key)
+        return surface
+
+    def put(self, key, surface):
+        "Add a surface to the cache."
+        if key in self._surfaces:
+            self.remove(key)
+        self._surfaces[key] = surface
+        self._order.append(key)
+        self._bytes += _surface_bytes(surface)
+        while self._bytes > self.max_bytes and len(self._order) > 1:
+            self.remove(self._order[0])
+
+    def remove(self, key):
+        "Remove a surface from the cache."
+        surface = self._surfaces.pop(key, None)
+        if surface is not None:
+            self._order.remove(key)
+            self._bytes -= _surface_bytes(surface)
+
+    def invalidate(self, theme=None):
+        "Remove the surfaces of `theme`, or all surfaces if it is None."
+        if theme is None:
+            exposong.log.debug("Clearing the slide cache.")
+            self._surfaces = {}
+            self._order = []
+            self._bytes = 0
+            return
+        for key in self._order[:]:
+            if key[0] is theme:
+                self.remove(key)
+
+    def __len__(self):
+        return len(self._surfaces)
+
+
+def _surface_bytes(surface):
+    "Return the memory used by an ImageSurface."
+    return surface.get_width() * surface.get_height() * 4
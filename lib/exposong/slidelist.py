@@ -23,6 +23,8 @@ The SlideList class displays the slides for the currently select presentation.
 import gtk
 import gobject
 
+import exposong.preslist
+import exposong.schedlist
 import exposong.screen
 import exposong.statusbar
 from exposong import config
@@ -44,6 +46,8 @@ class SlideList(gtk.TreeView, exposong._hook.Menu):
         self.__pres_mv = 0
         # Used to stop or reset the timer if the presentation or slide changes.
         self.__timer = 0
+        # The idle task that renders the slides that may be shown next.
+        self._prefetch_id = 0
 
         gtk.TreeView.__init__(self)
         self.set_size_request(250, -1)
@@ -69,26 +73,34 @@ class SlideList(gtk.TreeView, exposong._hook.Menu):
         self.set_model(slist)
         exposong.log.debug('Activating "%s" %s presentation.',
                            pres.get_title(), pres.get_type())
+        if not pres.is_loaded():
+            pres.load()
         if not hasattr(self, 'pres_type') or\
                 self.pres_type is not pres.get_type():
             self.pres_type = pres.get_type()
             pres.slide_column(self.column1)
         
-        if config.config.get('songs', 'show_in_order') == "True"\
-                and pres.get_type() == "song":
-            slides = pres.get_slides_in_order()
-        else:
-            slides = pres.get_slide_list()
-        for slide in slides:
+        for slide in self.get_slides(pres):
             slist.append(slide)
         
-        if pres.get_type() == "song" and config.config.get('songs', 'title_slide') == "True":
-            slist.insert(0,pres.get_title_slide())
-        
         self.__timer += 1
         men = slist.get_iter_first() is not None
         self._actions.get_action("pres-slide-next").set_sensitive(men)
         self._actions.get_action("pres-slide-prev").set_sensitive(men)
+        self._start_prefetch()
+    
+    @staticmethod
+    def get_slides(pres):
+        'Return the (slide, markup) rows for a presentation.'
+        if config.config.get('songs', 'show_in_order') == "True"\
+                and pres.get_type() == "song":
+            slides = list(pres.get_slides_in_order())
+        else:
+            slides = list(pres.get_slide_list())
+        
+        if pres.get_type() == "song" and config.config.get('songs', 'title_slide') == "True":
+            slides.insert(0, pres.get_title_slide())
+        return slides
     
     def update(self):
         '''When something in the presentation has changed, reset the slidelist and
@@ -180,8 +192,65 @@ class SlideList(gtk.TreeView, exposong._hook.Menu):
     
     def _on_slide_activate(self, *args):
         'Present the selected slide to the screen.'
-        exposong.screen.screen.draw()
+        exposong.screen.screen.draw(True)
         self.reset_timer()
+        self._start_prefetch()
+    
+    def _start_prefetch(self):
+        'Render the slides that may be shown next in idle time.'
+        if self._prefetch_id:
+            gobject.source_remove(self._prefetch_id)
+            self._prefetch_id = 0
+        if not exposong.screen.screen.is_viewable():
+            return
+        task = self._prefetch()
+        self._prefetch_id = gobject.idle_add(task.next,
+                                             priority=gobject.PRIORITY_LOW)
+    
+    def _prefetch(self):
+        """
+        Render the next and previous slide. At the end of the slides, also
+        render the first slide of the next presentation in a custom schedule
+        (see `check_open_pres`).
+        
+        If no slide is selected yet, render the first slide. This also
+        calculates the font size of the presentation.
+        """
+        model, itr = self.get_selection().get_selected()
+        slides = []
+        if not itr and len(model):
+            slides.append(model[0][0])
+        elif itr:
+            path = model.get_path(itr)[0]
+            itr_next = model.iter_next(itr)
+            if itr_next:
+                slides.append(model.get_value(itr_next, 0))
+            if path > 0:
+                slides.append(model[path - 1][0])
+            if not itr_next:
+                slides.extend(self._get_next_pres_slide())
+        for slide in slides:
+            exposong.screen.screen.prerender(slide)
+            yield True
+        self._prefetch_id = 0
+        yield False
+    
+    def _get_next_pres_slide(self):
+        'Return a list with the first slide of the next presentation.'
+        sched = exposong.schedlist.schedlist.get_active_item()
+        preslist = exposong.preslist.preslist
+        if not sched or sched.is_builtin() or preslist.is_last_pres_active():
+            return []
+        model, itr = preslist.get_selection().get_selected()
+        if not itr or not model.iter_next(itr):
+            return []
+        pres = model.get_value(model.iter_next(itr), 0).presentation
+        if not pres.is_loaded():
+            pres.load()
+        slides = self.get_slides(pres)
+        if not slides:
+            return []
+        return [slides[0][0]]
     
     def reset_timer(self):
         'Restart the timer.'
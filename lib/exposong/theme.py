@@ -37,18 +37,19 @@ Margins are measured in Pixels.
 """
 
 import cairo
-import gobject
 import gtk
 import gtk.gdk
 import math
 import operator
 import os.path
 import pango
-from gtk.gdk import pixbuf_new_from_file as pb_new
 from xml.etree import cElementTree as etree
 
+import exposong.imagecache
 import exposong.main
+import exposong.timing
 from exposong import DATA_PATH
+from exposong.config import config
 
 LEFT = pango.ALIGN_LEFT
 CENTER = pango.ALIGN_CENTER
@@ -64,6 +65,13 @@ POS_MAP = {'x1': 0, 'y1': 1, 'x2': 2, 'y2': 3,
             0: 'x1', 1: 'y1', 2: 'x2', 3: 'y2',
             }
 
+# The radius in pixels of the blur applied to text shadows.
+SHADOW_BLUR = 2
+
+# Text layouts that were fitted to their box, by markup, font and box size.
+_layout_cache = {}
+LAYOUT_CACHE_SIZE = 256
+
 
 class Theme(object):
     """
@@ -74,6 +82,8 @@ class Theme(object):
         self._builtin = builtin
         self.meta = {}
         self.backgrounds = []
+        self._bg_cache = {}
+        self._revision = 0
         self._init_sections()
         
         if filename:
@@ -129,6 +139,7 @@ class Theme(object):
         self._init_sections()
         self.meta = {}
         self.backgrounds = []
+        self.reset_cache()
         if self.filename:
             self.load(etree.parse(os.path.join(DATA_PATH, 'theme', self.filename)))
     
@@ -142,6 +153,7 @@ class Theme(object):
         if etree.iselement(meta):
             for el in meta:
                 self.meta[el.tag] = el.text
+        self.reset_cache()
         backgrounds = root.find(u'background')
         for bg in backgrounds.getchildren():
             bgobj = _Background.create_element(bg)
@@ -184,11 +196,49 @@ class Theme(object):
         root.append(sections)
         return root
     
+    def reset_cache(self):
+        "Forget the rendered backgrounds. Call this when they were changed."
+        self._bg_cache = {}
+        self._revision += 1
+    
+    def get_revision(self):
+        "Return a number that changes every time the theme is changed."
+        return self._revision
+    
+    def get_background(self, size):
+        "Return an ImageSurface with all backgrounds drawn at `size`."
+        size = tuple(size)
+        if size not in self._bg_cache:
+            if len(self._bg_cache) >= 4:
+                # Only a few sizes are used at the same time.
+                self._bg_cache = {}
+            surface = cairo.ImageSurface(cairo.FORMAT_RGB24,
+                                         *[int(math.ceil(s)) for s in size])
+            ccontext = gtk.gdk.CairoContext(cairo.Context(surface))
+            self.render_color(ccontext, size, '#000')
+            misses = exposong.imagecache.cache.misses
+            for bg in self.backgrounds:
+                bg.draw(ccontext, size)
+            if exposong.imagecache.cache.misses != misses:
+                # An image is still being read, draw it again next time.
+                return surface
+            self._bg_cache[size] = surface
+        return self._bg_cache[size]
+    
     def render(self, ccontext, bounds, slide):
         "Render the theme to the screen."
-        self.render_color(ccontext, bounds, '#000')
-        for bg in self.backgrounds:
-            bg.draw(ccontext, bounds)
+        if len(bounds) == 4:
+            x, y = bounds[:2]
+        else:
+            x = y = 0
+        started = exposong.timing.start()
+        ccontext.save()
+        ccontext.rectangle(x, y, *bounds[-2:])
+        ccontext.clip()
+        ccontext.set_source_surface(self.get_background(bounds[-2:]), x, y)
+        ccontext.paint()
+        ccontext.restore()
+        exposong.timing.stop('background', started)
         if slide:
             cont = slide.get_slide()
             if cont != NotImplemented:
@@ -200,18 +250,50 @@ class Theme(object):
                         self.slide.pos = [0.0, 0.0, 1.0, 1.0]
                         t.draw(ccontext, bounds, self.slide)
             else:
-                expand = {}
-                foots = slide.get_footer()
-                for t in foots:
+                size = None
+                pres = getattr(slide, 'pres', None)
+                if config.get("screen", "uniform_font") == "True" and \
+                        hasattr(pres, "get_body_size"):
+                    size = pres.get_body_size(self, bounds)
+                for t in slide.get_footer():
                     t.draw(ccontext, bounds, self.footer)
-                if not foots:
-                    for k in self.body.expand:
-                        k2 = k.split(".")
-                        if k2[0] == 'footer':
-                            # Expand over the footer if it doesn't exist.
-                            expand[k2[1]] = self.footer.pos[POS_MAP[k2[1]]]
+                expand = self._get_body_expand(slide)
                 for t in slide.get_body():
-                    t.draw(ccontext, bounds, self.body, expand)
+                    if size and isinstance(t, Text):
+                        t.draw(ccontext, bounds, self.body, expand, size)
+                    else:
+                        t.draw(ccontext, bounds, self.body, expand)
+    
+    def _get_body_expand(self, slide):
+        "Return the positions the body expands to on `slide`."
+        expand = {}
+        if not slide.get_footer():
+            for k in self.body.expand:
+                k2 = k.split(".")
+                if k2[0] == 'footer':
+                    # Expand over the footer if it doesn't exist.
+                    expand[k2[1]] = self.footer.pos[POS_MAP[k2[1]]]
+        return expand
+    
+    def get_body_size(self, bounds, slides):
+        """
+        Return the largest font size (in Pango units) at which the body text
+        of all `slides` fits, or None if they have no text.
+        """
+        surface = cairo.ImageSurface(cairo.FORMAT_A8,
+                                     *[int(math.ceil(b)) for b in bounds[-2:]])
+        ccontext = gtk.gdk.CairoContext(cairo.Context(surface))
+        size = None
+        for slide in slides:
+            if slide.get_slide() != NotImplemented:
+                continue
+            expand = self._get_body_expand(slide)
+            for t in slide.get_body():
+                if isinstance(t, Text):
+                    s = t.get_font_size(ccontext, bounds, self.body, expand)
+                    if size is None or s < size:
+                        size = s
+        return size
     
     @classmethod
     def render_color(cls, ccontext, bounds, color):
@@ -557,8 +639,6 @@ class ImageBackground(_Background, _Renderable):
         _Background.__init__(self, name)
         self.src = src
         self.aspect = aspect
-        self._original = None
-        self._cache = {}
     
     def parse_xml(self, el):
         "Defines variables based on XML values."
@@ -579,24 +659,14 @@ class ImageBackground(_Background, _Renderable):
     def get_filename(self):
         return os.path.join(DATA_PATH, 'theme', 'res', self.src)
     
-    def reset_cache(self):
-        self._original = None
-        self._cache = {}
-    
     def load(self, size):
-        ""
-        if not self._original:
-            try:
-                self._original = pb_new(self.get_filename())
-            except gobject.GError:
-                exposong.log.error('Could not find "%s".', self.src)
-                return False
-        
-        size[:] = get_size(self._original, size, self.aspect)
-        skey = 'x'.join(map(str, size))
-        if skey not in self._cache:
-            self._cache[skey] = scale_image(self._original, size, self.aspect)
-        return self._cache[skey]
+        "Load the image scaled to `size`, and set `size` to the image size."
+        img = exposong.imagecache.cache.load(self.get_filename(), size,
+                                             self.aspect)
+        if not img:
+            return False
+        size[:] = [img.get_width(), img.get_height()]
+        return img
     
     def draw(self, ccontext, bounds):
         "Render the background to the context."
@@ -780,34 +850,15 @@ class Text(_RenderableSection):
         _RenderableSection.__init__(self, align, valign, margin, pos)
         self.markup = markup
     
-    def draw(self, ccontext, bounds, section, expand={}):
-        "Render to a Cairo Context."
-        _RenderableSection.draw(self, ccontext, bounds, section, expand)
-        screen_height = (self.rpos[3] + self.margin) / self.pos[3]
-        
-        layout = ccontext.create_layout()
-        layout.set_width(int(self.rpos[2] - self.rpos[0])*pango.SCALE)
-        if section.font:
-            font_descr = pango.FontDescription(section.font)
-        else:
-            font_descr = pango.FontDescription("Sans 48")
-        font_descr.set_size(int(font_descr.get_size() * screen_height / 768))
-        layout.set_font_description(font_descr)
-        layout.set_spacing(int((section.spacing - 1.0) * font_descr.get_size()))
-        
-        if self.align != None:
-            layout.set_alignment(self.align)
-        elif section.align != None:
-            layout.set_alignment(section.align)
-        else:
-            layout.set_alignment(CENTER)
-        
-        layout.set_markup(self.markup)
+    def draw(self, ccontext, bounds, section, expand={}, size=None):
+        """
+        Render to a Cairo Context.
         
-        while layout.get_pixel_size()[1] > self.rpos[3] - self.rpos[1]:
-            font_descr.set_size(int(font_descr.get_size()*0.95))
-            layout.set_spacing(int((section.spacing - 1.0) * font_descr.get_size()))
-            layout.set_font_description(font_descr)
+        If `size` is given, the font will not be larger than `size`.
+        """
+        _RenderableSection.draw(self, ccontext, bounds, section, expand)
+        layout = self._get_layout(ccontext, section, size)
+        font_descr = layout.get_font_description()
         
         if self.valign != None:
             valign = self.valign
@@ -825,32 +876,84 @@ class Text(_RenderableSection):
                   layout.get_pixel_size()[1] / 2
         
         if section.shadow_color:
+            started = exposong.timing.start()
             clr = gtk.gdk.color_parse(section.shadow_color)
             ccontext.set_source_rgba(clr.red / 65535.0, clr.green / 65535.0,
                                      clr.blue / 65535.0,
-                                     section.shadow_opacity * 0.05)
+                                     section.shadow_opacity)
             sz = font_descr.get_size() / pango.SCALE
             center = [self.rpos[0] + sz * section.shadow_offset[0],
                              top + sz * section.shadow_offset[1]]
-            for x in range(-2, 3, 1):
-                for y in range(-2, 3, 1):
-                    ccontext.move_to(center[0]+x, center[1]+y)
-                    ccontext.show_layout(layout)
-        if section.outline_color:
+            mask, offset = _layout_mask(layout, SHADOW_BLUR)
+            ccontext.mask_surface(_box_blur(mask, SHADOW_BLUR),
+                                  center[0] + offset[0], center[1] + offset[1])
+            exposong.timing.stop('shadow', started)
+        if section.outline_color and int(section.outline_size) > 0:
+            started = exposong.timing.start()
             clr = gtk.gdk.color_parse(section.outline_color)
             ccontext.set_source_rgb(clr.red / 65535.0, clr.green / 65535.0,
                                     clr.blue / 65535.0)
-            offset = int(section.outline_size)
-            for x in range(-offset, offset + 1, 1):
-                for y in range(-offset, offset + 1, 1):
-                    ccontext.move_to(self.rpos[0]+x, top+y)
-                    ccontext.show_layout(layout)
+            # The stroke reaches outline_size outside of the glyphs.
+            ccontext.new_path()
+            ccontext.move_to(self.rpos[0], top)
+            ccontext.layout_path(layout)
+            ccontext.set_line_width(2 * int(section.outline_size))
+            ccontext.set_line_join(cairo.LINE_JOIN_ROUND)
+            ccontext.stroke()
+            exposong.timing.stop('outline', started)
         
+        started = exposong.timing.start()
         clr = gtk.gdk.color_parse(section.color)
         ccontext.set_source_rgba(clr.red / 65535.0, clr.green / 65535.0,
                                  clr.blue / 65535.0, 1.0)
         ccontext.move_to(self.rpos[0], top)
         ccontext.show_layout(layout)
+        exposong.timing.stop('text', started)
+    
+    def get_font_size(self, ccontext, bounds, section, expand={}):
+        "Return the font size (in Pango units) at which the text fits."
+        _RenderableSection.draw(self, ccontext, bounds, section, expand)
+        layout = self._get_layout(ccontext, section)
+        return layout.get_font_description().get_size()
+    
+    def _get_layout(self, ccontext, section, size=None):
+        "Return a layout of the text, fitted to the position."
+        screen_height = (self.rpos[3] + self.margin) / self.pos[3]
+        
+        width = int(self.rpos[2] - self.rpos[0])
+        height = self.rpos[3] - self.rpos[1]
+        if section.font:
+            font_descr = pango.FontDescription(section.font)
+        else:
+            font_descr = pango.FontDescription("Sans 48")
+        font_descr.set_size(int(font_descr.get_size() * screen_height / 768))
+        if size is not None and size < font_descr.get_size():
+            font_descr.set_size(size)
+        
+        if self.align != None:
+            align = self.align
+        elif section.align != None:
+            align = section.align
+        else:
+            align = CENTER
+        
+        key = (self.markup, font_descr.to_string(), section.spacing, align,
+               width, int(height))
+        layout = _layout_cache.get(key)
+        if layout is None:
+            started = exposong.timing.start()
+            layout = ccontext.create_layout()
+            layout.set_width(width*pango.SCALE)
+            layout.set_alignment(align)
+            layout.set_markup(self.markup)
+            _fit_layout(layout, font_descr, section.spacing, height)
+            if len(_layout_cache) >= LAYOUT_CACHE_SIZE:
+                _layout_cache.clear()
+            _layout_cache[key] = layout
+            exposong.timing.stop('text fit', started)
+        else:
+            ccontext.update_layout(layout)
+        return layout
 
 
 class Image(_RenderableSection):
@@ -862,24 +965,13 @@ class Image(_RenderableSection):
         _RenderableSection.__init__(self, align, valign, margin, pos)
         self.src = src
         self.aspect = aspect
-        self._original = None
-        self._cache = {'x': None}
     
     def load(self, size):
         "Loads an image based on a requested size [width, height]."
         if not self.src or not os.path.isfile(self.src):
             return False
-        if not self._original:
-            try:
-                self._original = pb_new(self.src)
-            except gobject.GError:
-                exposong.log.error('Could not find "%s".', self.src)
-                return False
-        
-        skey = 'x'.join(map(str, get_size(self._original, size, self.aspect)))
-        if skey not in self._cache:
-            self._cache[skey] = scale_image(self._original, size, self.aspect)
-        return self._cache[skey]
+        return exposong.imagecache.cache.load(self.src, size,
+                                              self.aspect) or False
     
     def draw(self, ccontext, bounds, section, expand={}):
         "Render to a Cairo Context."
@@ -1088,6 +1180,74 @@ def scale_image(pb, size, aspect=None):
                               gtk.gdk.INTERP_BILINEAR)
     return npb
 
+def _set_font_size(layout, font_descr, spacing, size):
+    "Set the font size (in Pango units) and line spacing of the layout."
+    font_descr.set_size(size)
+    layout.set_font_description(font_descr)
+    layout.set_spacing(int((spacing - 1.0) * size))
+
+def _fit_layout(layout, font_descr, spacing, height):
+    """
+    Set the largest font size, up to the size of `font_descr`, at which the
+    layout is not higher than `height`.
+    
+    The size is found with a binary search to a quarter point.
+    """
+    high = font_descr.get_size()
+    _set_font_size(layout, font_descr, spacing, high)
+    if layout.get_pixel_size()[1] <= height:
+        return high
+    low = min(pango.SCALE, high)
+    while high - low > pango.SCALE / 4:
+        mid = (low + high) // 2
+        _set_font_size(layout, font_descr, spacing, mid)
+        if layout.get_pixel_size()[1] <= height:
+            low = mid
+        else:
+            high = mid
+    _set_font_size(layout, font_descr, spacing, low)
+    return low
+
+def _layout_mask(layout, pad=0):
+    """
+    Render the glyphs of a Pango layout into an alpha-only surface.
+    
+    Returns the surface and the position of its top left corner relative to
+    the layout origin. `pad` pixels are added on each side.
+    """
+    ink, logical = layout.get_pixel_extents()
+    x1 = min(ink[0], logical[0]) - pad
+    y1 = min(ink[1], logical[1]) - pad
+    x2 = max(ink[0] + ink[2], logical[0] + logical[2]) + pad
+    y2 = max(ink[1] + ink[3], logical[1] + logical[3]) + pad
+    mask = cairo.ImageSurface(cairo.FORMAT_A8, max(x2 - x1, 1),
+                              max(y2 - y1, 1))
+    ccontext = gtk.gdk.CairoContext(cairo.Context(mask))
+    ccontext.move_to(-x1, -y1)
+    ccontext.show_layout(layout)
+    return mask, (x1, y1)
+
+def _box_blur(mask, radius):
+    """
+    Return a copy of an alpha-only surface with a box blur.
+    
+    The blur is done in a horizontal and a vertical pass. Each pass adds up
+    the surface at 2*radius+1 offsets, each with an equal share of the alpha.
+    """
+    if radius <= 0:
+        return mask
+    width, height = mask.get_width(), mask.get_height()
+    weight = 1.0 / (2 * radius + 1)
+    for dx, dy in ((1, 0), (0, 1)):
+        blurred = cairo.ImageSurface(cairo.FORMAT_A8, width, height)
+        ccontext = cairo.Context(blurred)
+        ccontext.set_operator(cairo.OPERATOR_ADD)
+        for i in range(-radius, radius + 1):
+            ccontext.set_source_surface(mask, i * dx, i * dy)
+            ccontext.paint_with_alpha(weight)
+        mask = blurred
+    return mask
+
 def _product(*args):
     "Multiply all arguments."
     return reduce(operator.mul, args)
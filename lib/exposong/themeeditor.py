@@ -23,6 +23,7 @@ import shutil
 import random
 import gobject
 
+import exposong.imagecache
 import exposong.theme
 import exposong.exampleslide
 from exposong import gui
@@ -48,6 +49,8 @@ class ThemeEditor(gtk.Window):
         self.__updating = False
         self._do_layout()
         self._load_theme(theme_)
+        self._image_handler = exposong.imagecache.cache.connect(
+                'image-loaded', self.draw)
         self.show_all()
     
     def _do_layout(self):
@@ -198,6 +201,7 @@ the first element in this list moving to the last one."), 0)
     
     def draw(self, *args):
         'Called to update the preview widget'
+        self.theme.reset_cache()
         self._preview.queue_draw()
     
     def _expose(self, widget, event):
@@ -412,7 +416,6 @@ in percentage of font height. So an offset of 0.5 for point 12 font is 6 points.
             if newpath != img:
                 shutil.copy(img, newpath)
             bg.src = os.path.basename(img)
-            bg.reset_cache()
         if self._bg_image_radio_mode_fill.get_active():
             bg.aspect = exposong.theme.ASPECT_FILL
         else:
@@ -1024,6 +1027,7 @@ Do you want to save?")
             elif resp == gtk.RESPONSE_OK:
                 self._save_changes()
             dialog.destroy()
+        exposong.imagecache.cache.disconnect(self._image_handler)
         self.destroy()
         global __name__
         if __name__ == "__main__":
@@ -27,8 +27,10 @@ import pango
 import re
 from gtk.gdk import pixbuf_new_from_file as pb_new
 
+import exposong.imagecache
 import exposong.main
 import exposong.screen
+import exposong.slidecache
 import exposong.theme
 import exposong.exampleslide
 from exposong import themeeditor
@@ -163,6 +165,7 @@ class ThemeSelect(gtk.ComboBox, exposong._hook.Menu, object):
     
     def _update_theme(self, editor, theme, *args):
         self._delete_theme_thumb(theme)
+        exposong.slidecache.cache.invalidate(theme)
         exposong.screen.screen.draw()
     
     def _delete_theme(self, *args):
@@ -341,7 +344,12 @@ class CellRendererTheme(gtk.GenericCellRenderer):
             bounds = (0, 0, SCALED_HEIGHT * CELL_ASPECT, SCALED_HEIGHT)
             ccontext.scale(float(width) / bounds[2],
                            float(height) / bounds[3])
-            self.theme.render(ccontext, bounds, self.slide)
+            # Thumbnails are saved, so wait for the images to be read.
+            exposong.imagecache.cache.threaded = False
+            try:
+                self.theme.render(ccontext, bounds, self.slide)
+            finally:
+                exposong.imagecache.cache.threaded = True
             if self.can_cache:
                 # Save the rendered image to cache
                 pb = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, True, 8, width,
@@ -0,0 +1,108 @@
+#
+# vim: ts=4 sw=4 expandtab ai:
+#
+# Copyright (C) 2008-2011 Exposong.org
+#
+# ExpoSong is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Records how long the stages of drawing the screen take.
+
+Timing is off unless ExpoSong is started with --timing or --timing-file. The
+most recent times are kept, and can be seen in the event log window.
+
+A stage is timed like this:
+
+    start = exposong.timing.start()
+    ...
+    exposong.timing.stop('shadow', start)
+"""
+
+import collections
+import threading
+import time
+from timeit import default_timer as _timer
+
+# The number of times that are kept.
+RING_SIZE = 5000
+
+enabled = False
+
+_times = collections.deque(maxlen=RING_SIZE)
+_lock = threading.Lock()
+
+
+def start():
+    "Return the start time of a stage, or None if timing is off."
+    if enabled:
+        return _timer()
+    return None
+
+def stop(stage, started):
+    "Record the time since `started` (from `start()`) for `stage`."
+    if started is None:
+        return
+    duration = _timer() - started
+    _lock.acquire()
+    try:
+        _times.append((time.time(), stage, duration))
+    finally:
+        _lock.release()
+
+def reset():
+    "Forget all recorded times."
+    _lock.acquire()
+    try:
+        _times.clear()
+    finally:
+        _lock.release()
+
+def get_times():
+    "Return a list of the recorded (time, stage, seconds)."
+    _lock.acquire()
+    try:
+        return list(_times)
+    finally:
+        _lock.release()
+
+def get_summary():
+    """
+    Return a list of (stage, count, mean, maximum, last) with the times in
+    seconds, sorted by stage.
+    """
+    stages = {}
+    for when, stage, duration in get_times():
+        if stage not in stages:
+            stages[stage] = [0, 0.0, 0.0, 0.0]
+        st = stages[stage]
+        st[0] += 1
+        st[1] += duration
+        st[2] = max(st[2], duration)
+        st[3] = duration
+    return [(stage, st[0], st[1] / st[0], st[2], st[3])
+            for stage, st in sorted(stages.iteritems())]
+
+def dump(filename):
+    "Write the recorded times and a summary to `filename`."
+    out = open(filename, "w")
+    try:
+        out.write("# stage, count, mean ms, max ms, last ms\n")
+        for row in get_summary():
+            out.write("# %s\t%d\t%.3f\t%.3f\t%.3f\n" % (row[0], row[1],
+                      row[2] * 1000, row[3] * 1000, row[4] * 1000))
+        out.write("# time, stage, ms\n")
+        for when, stage, duration in get_times():
+            out.write("%.3f\t%s\t%.3f\n" % (when, stage, duration * 1000))
+    finally:
+        out.close()
@@ -0,0 +1,252 @@
+#
+# vim: ts=4 sw=4 expandtab ai:
+#
+# Copyright (C) 2008-2011 Exposong.org
+#
+# ExpoSong is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Makes the headers of presentations that are stored in the library index, and
+reads the headers of songs in separate processes.
+
+This module does not use GTK or the exposong package, so that it can run in a
+new Python process (`python -m presheader`). Such a process reads OpenLyrics
+files and sends their headers back, and never writes a file. Songs that need
+to be converted to a newer OpenLyrics version, and all other files, are left
+for ExpoSong to read.
+"""
+
+import Queue
+import cPickle as pickle
+import os
+import re
+import subprocess
+import sys
+import threading
+import unicodedata
+
+from exposong_openlyrics import openlyrics
+import exposong_openlyrics.tools.convert_schema as convert_schema
+
+blacklist = "[.,'?!]" # [ and ] are part of the regex
+
+
+def normalize(text):
+    "Return the text in lowercase without accents, for searching."
+    text = unicodedata.normalize('NFKD', text)
+    text = u"".join(c for c in text if not unicodedata.combining(c))
+    return text.lower().replace(u"\xdf", u"ss")
+
+def tokenize(element):
+    "Return the set of normalized words in an item."
+    words = set()
+    if element is None:
+        return words
+    if isinstance(element, (list, tuple)):
+        for item in element:
+            words.update(tokenize(item))
+        return words
+    if isinstance(element, str):
+        text = element.decode('utf-8', 'replace')
+    else:
+        text = unicode(element)
+    text = re.sub(blacklist, "", normalize(text))
+    words.update(re.findall(r'\w+', text, re.U))
+    return words
+
+def make_header(title, slides, titles=(), info=()):
+    """
+    Return the header of a presentation for the library index.
+
+    `slides` is a list of (name, title, text) for each slide. `titles` are
+    other titles, and `info` are other items that can be searched for.
+    """
+    fields = {'title': tokenize(title), 'first-line': set(), 'text': set(),
+              'info': tokenize(info)}
+    fields['title'].update(tokenize(titles))
+    outline = []
+    for name, slide_title, text in slides:
+        first_line = text.strip().partition('\n')[0]
+        if not outline:
+            fields['first-line'] = tokenize(first_line)
+        fields['text'].update(tokenize(slide_title))
+        fields['text'].update(tokenize(text))
+        outline.append((name, first_line))
+    return {'title': title,
+            'fields': dict((k, sorted(v)) for k, v in fields.iteritems()),
+            'outline': outline}
+
+def verse_text(verse):
+    "Return the text of an OpenLyrics verse, a line for each line."
+    lineList = []
+    if len(verse.lines) > 1:
+        for i in range(max(len(l.lines) for l in verse.lines)):
+            for lines in verse.lines:
+                if i < len(lines.lines):
+                    lineList.append("%s: %s" % (lines.part, lines.lines[i]))
+        return '\n'.join(lineList)
+    elif len(verse.lines) == 1:
+        return str(verse.lines[0])
+    else:
+        return ''
+
+def verse_title(name, verse_names):
+    'Return the title of the verse `name`, like "Verse 1" for "v1".'
+    if name[0] in verse_names:
+        return "%s %s" % (verse_names[name[0]], name[1:])
+    return name
+
+def song_info(song):
+    "Return the titles and the other words of a song that can be searched."
+    props = song.props
+    return props.titles, [props.authors, props.songbooks, props.ccli_no,
+                          props.themes, props.comments, props.variant,
+                          props.keywords]
+
+def song_header(song):
+    "Return the parts of a song header that are not in `make_header()`."
+    props = song.props
+    return {'titles': [(t.text, t.lang, t.translit) for t in props.titles],
+            'themes': [(t.name, t.lang, t.translit) for t in props.themes],
+            'authors': [(a.name, a.type, a.lang) for a in props.authors],
+            'songbooks': [(s.name, s.entry) for s in props.songbooks]}
+
+def is_song(filename):
+    "Return True if `filename` is an OpenLyrics file."
+    fl = open(filename, 'r')
+    try:
+        for i, ln in enumerate(fl):
+            if i > 2:
+                break
+            if re.search(r'<song\b', ln):
+                return True
+    finally:
+        fl.close()
+    return False
+
+def is_latest_version(song):
+    "Return True if the song has the newest OpenLyrics version."
+    song_version = song.get_version().split(".")
+    latest = convert_schema.TARGET_OPENLYRICS_VER.split(".")
+    return not (song_version[0] < latest[0] or (song_version[0] == latest[0]
+                                                and song_version[1] < latest[1]))
+
+def read_song_header(filename, verse_names):
+    """
+    Return the header of the song `filename`, or None if ExpoSong has to read
+    the file itself.
+    """
+    if not is_song(filename):
+        return None
+    song = openlyrics.Song(filename)
+    if not is_latest_version(song):
+        return None
+    if len(song.props.titles) == 0:
+        title = os.path.basename(filename)
+    else:
+        title = str(song.props.titles[0])
+    slides = [(v.name, verse_title(v.name, verse_names), verse_text(v))
+              for v in song.verses]
+    titles, info = song_info(song)
+    header = make_header(title, slides, titles, info)
+    header.update(song_header(song))
+    return header
+
+
+class HeaderReader(object):
+    """
+    Reads the headers of songs in new Python processes.
+
+    The results are (filename, header), where the header is None if ExpoSong
+    has to read the file itself. After the result of every file, `get()`
+    raises StopIteration.
+    """
+    def __init__(self, filenames, verse_names, processes):
+        self._queue = Queue.Queue()
+        self._running = 0
+        env = dict(os.environ)
+        path = os.path.dirname(os.path.abspath(__file__))
+        env['PYTHONPATH'] = os.pathsep.join([path] +
+                filter(None, [env.get('PYTHONPATH')]))
+        for i in range(processes):
+            files = filenames[i::processes]
+            if not files:
+                continue
+            self._running += 1
+            try:
+                proc = subprocess.Popen([sys.executable, '-m', 'presheader'],
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, env=env,
+                                        close_fds=(os.name != 'nt'))
+            except OSError:
+                # Leave the files to ExpoSong.
+                for filename in files:
+                    self._queue.put((filename, None))
+                self._queue.put(None)
+                continue
+            thread = threading.Thread(target=self._read, args=(proc, files,
+                                      verse_names), name="presheader-%d" % i)
+            thread.setDaemon(True)
+            thread.start()
+
+    def _read(self, proc, files, verse_names):
+        "Send the files to a process and queue its results."
+        done = set()
+        try:
+            pickle.dump((files, verse_names), proc.stdin,
+                        pickle.HIGHEST_PROTOCOL)
+            proc.stdin.close()
+            while True:
+                filename, header = pickle.load(proc.stdout)
+                done.add(filename)
+                self._queue.put((filename, header))
+        except (EOFError, IOError, pickle.UnpicklingError):
+            pass
+        proc.wait()
+        # Leave the files that were not read to ExpoSong.
+        for filename in files:
+            if filename not in done:
+                self._queue.put((filename, None))
+        self._queue.put(None)
+
+    def get(self, timeout):
+        """
+        Return the next (filename, header). Raises Queue.Empty if there is
+        none after `timeout` seconds.
+        """
+        while self._running:
+            result = self._queue.get(True, timeout)
+            if result is not None:
+                return result
+            self._running -= 1
+        raise StopIteration
+
+
+def _serve():
+    "Read the headers of the files sent on stdin, and write them to stdout."
+    if os.name == 'nt':
+        import msvcrt
+        msvcrt.setmode(sys.stdin.fileno(), os.O_BINARY)
+        msvcrt.setmode(sys.stdout.fileno(), os.O_BINARY)
+    files, verse_names = pickle.load(sys.stdin)
+    for filename in files:
+        try:
+            header = read_song_header(filename, verse_names)
+        except Exception:
+            header = None
+        pickle.dump((filename, header), sys.stdout, pickle.HIGHEST_PROTOCOL)
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    _serve()
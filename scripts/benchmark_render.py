@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2008-2011 Exposong.org
+#
+# ExpoSong is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This script renders themes and lyric slides into cairo ImageSurfaces, without
+opening a window, and prints the frames per second and the time of each
+drawing stage.
+
+The shipped theme (data/theme/exposong.xml) and themes with gradient, radial
+gradient and image backgrounds are rendered with slides of different lengths.
+The synthetic themes have text shadows and outlines.
+
+Each combination is rendered "cold", with the background, layout and image
+caches emptied before every frame, and "warm", with the caches kept.
+
+ExpoSong is started with a temporary data folder and config file, so your
+data is not changed. Close ExpoSong before running this script.
+"""
+
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+ROOT = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+VERSE = ["Amazing grace, how sweet the sound",
+         "That sav'd a wretch like me!",
+         "I once was lost, but now am found",
+         "Was blind, but now I see."]
+
+def parse_args():
+    "Return the options of the benchmark."
+    parser = optparse.OptionParser(usage="%prog [options]",
+                                   description="Benchmark the rendering of themes and slides.")
+    parser.add_option('-s', '--size', dest='size', default='1280x720',
+                      help='The screen size as WIDTHxHEIGHT (default 1280x720).')
+    parser.add_option('-n', '--frames', dest='frames', type='int', default=20,
+                      help='The number of frames for each theme and slide (default 20).')
+    parser.add_option('-l', '--lines', dest='lines', default='2,4,8,16',
+                      help='The slide lengths in lines (default 2,4,8,16).')
+    options = parser.parse_args()[0]
+    options.size = tuple(int(s) for s in options.size.split('x'))
+    options.lines = [int(n) for n in options.lines.split(',')]
+    return options
+
+def start_exposong(tmp):
+    "Import ExpoSong with a data folder and config file in `tmp`."
+    data = os.path.join(tmp, 'data')
+    shutil.copytree(os.path.join(ROOT, 'data', 'theme'),
+                    os.path.join(data, 'theme'))
+    sys.argv = [sys.argv[0], '-d', data, '-c', os.path.join(tmp, 'exposong.conf')]
+    sys.path.insert(0, os.path.join(ROOT, 'lib'))
+
+    global exposong, cairo, gtk
+    import cairo
+    import gtk
+    import exposong
+    import exposong.imagecache
+    import exposong.theme
+    import exposong.timing
+    exposong.timing.enabled = True
+    exposong.imagecache.cache = exposong.imagecache.ImageCache()
+    # Read images while rendering, like the cold start of a slide.
+    exposong.imagecache.cache.threaded = False
+
+
+class BenchSlide(object):
+    """
+    A lyric slide with a number of lines and a footer.
+    """
+    def __init__(self, lines):
+        self.id = '_bench%d' % lines
+        text = '\n'.join(VERSE[i % len(VERSE)] for i in range(lines))
+        self.body = [exposong.theme.Text(text, margin=0.04)]
+        self.foot = [exposong.theme.Text('\n'.join([
+                        '"Amazing Grace"', 'Written by: John Newton',
+                        'Copyright: Public Domain']), margin=0.04)]
+
+    def get_body(self):
+        "Returns the slide body text."
+        return self.body
+
+    def get_footer(self):
+        "Returns the slide footer text."
+        return self.foot
+
+    def get_slide(self):
+        return NotImplemented
+
+
+def get_themes(data):
+    "Return a list of (name, theme) to render."
+    t = exposong.theme
+    themes = [('exposong.xml',
+               t.Theme(os.path.join(ROOT, 'data', 'theme', 'exposong.xml')))]
+
+    gradient = t.GradientBackground(angle=45)
+    gradient.stops = [t.GradientStop(0.0, '#123'), t.GradientStop(1.0, '#8ac')]
+    radial = t.RadialGradientBackground(cpos=[0.5, 0.5], length=0.8)
+    radial.stops = [t.GradientStop(0.0, '#fa1'), t.GradientStop(1.0, '#210')]
+
+    # A large photo, like a background from a camera.
+    pb = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, 4000, 3000)
+    pb.fill(0x335577ff)
+    pb.save(os.path.join(data, 'theme', 'res', 'bench.jpg'), 'jpeg')
+    image = t.ImageBackground('bench.jpg', aspect=t.ASPECT_FILL)
+
+    for name, bg in (('gradient', gradient), ('radial', radial),
+                     ('image', image)):
+        theme = t.Theme()
+        theme.backgrounds.append(bg)
+        for section in (theme.body, theme.footer):
+            section.shadow_color = '#000'
+            section.shadow_opacity = 0.6
+            section.outline_color = '#333'
+            section.outline_size = 2
+        themes.append((name, theme))
+    return themes
+
+def reset_caches(theme):
+    "Forget everything that was rendered for `theme`."
+    theme.reset_cache()
+    exposong.theme._layout_cache.clear()
+    exposong.imagecache.cache.invalidate()
+    shutil.rmtree(os.path.join(exposong.DATA_PATH, '.cache', 'images'), True)
+
+def render(theme, slide, size, frames, cold):
+    "Render `slide` `frames` times. Return the frames per second."
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, *size)
+    ccontext = gtk.gdk.CairoContext(cairo.Context(surface))
+    reset_caches(theme)
+    if not cold:
+        theme.render(ccontext, size, slide)
+    total = 0.0
+    for i in range(frames):
+        if cold:
+            reset_caches(theme)
+        started = timer()
+        theme.render(ccontext, size, slide)
+        surface.flush()
+        total += timer() - started
+    return frames / total
+
+def print_stages(title):
+    "Print the recorded stage times, and forget them."
+    print
+    print "%s stages:" % title
+    print "  %-16s %7s %10s %10s" % ("stage", "count", "mean ms", "max ms")
+    for stage, count, mean, maximum, last in exposong.timing.get_summary():
+        print "  %-16s %7d %10.2f %10.2f" % (stage, count, mean * 1000,
+                                              maximum * 1000)
+    exposong.timing.reset()
+
+def main():
+    options = parse_args()
+    tmp = tempfile.mkdtemp(prefix='exposong-bench-')
+    try:
+        start_exposong(tmp)
+        themes = get_themes(os.path.join(tmp, 'data'))
+        slides = [BenchSlide(n) for n in options.lines]
+        print "Rendering at %dx%d, %d frames each." % (options.size +
+                                                       (options.frames,))
+
+        for cold in (True, False):
+            print
+            print "%-14s %6s %10s" % ("theme", "lines", "fps")
+            for name, theme in themes:
+                for slide, lines in zip(slides, options.lines):
+                    fps = render(theme, slide, options.size, options.frames,
+                                 cold)
+                    print "%-14s %6d %10.1f" % (name, lines, fps)
+            print_stages(cold and "Cold" or "Warm")
+    finally:
+        shutil.rmtree(tmp, True)
+
+if __name__ == '__main__':
+    main()
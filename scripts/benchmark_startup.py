@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2008-2011 Exposong.org
+#
+# ExpoSong is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This script creates a data folder with a number of OpenLyrics songs, ExpoSong
+presentations with images, schedules and themes, starts ExpoSong with it and
+prints how long each part of the startup takes.
+
+For every library size, ExpoSong is started twice: "cold", without the library
+index and theme thumbnails, and "warm", with the files saved by the first
+start. Each start runs in its own process.
+
+The timed parts are:
+
+  import           Importing exposong, including the config and data folders.
+  config           Reading the config file (exposong.config.Config).
+  plugins          Loading the plugins.
+  window           Creating the main window (Main.__init__, with plugins).
+  build_schedule   Adding the library and schedules to the schedule list.
+  build_pres_list  Reading the presentations into the library.
+  load_themes      Reading the themes (ThemeSelect._load_themes).
+  thumbnails       Drawing the theme thumbnails.
+  total            Everything, until the thumbnails are drawn.
+
+"busy" is the time spent in that part, "wall" is the time from its start until
+it finished, including the other parts that ran in between.
+
+The data is made the same way every time, so the results can be compared
+across releases. ExpoSong opens its window, so a display is needed (xvfb-run
+can be used). Close ExpoSong before running this script.
+"""
+
+import optparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+ROOT = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+PHASES = ('import', 'config', 'plugins', 'window', 'build_schedule',
+          'build_pres_list', 'load_themes', 'thumbnails', 'total')
+
+VERSE = ["Amazing grace, how sweet the sound",
+         "That sav'd a wretch like me!",
+         "I once was lost, but now am found",
+         "Was blind, but now I see."]
+SONGBOOKS = ["Hymns", "Worship", "Psalms", "Choruses", "Carols"]
+
+# The number of different images used by the presentations.
+IMAGES = 10
+# The number of presentations in each schedule.
+SCHEDULE_LENGTH = 20
+
+SONG = u"""<?xml version='1.0' encoding='UTF-8'?>
+<song xmlns="http://openlyrics.info/namespace/2009/song" version="0.8" \
+createdIn="ExpoSong" modifiedIn="ExpoSong" modifiedDate="2011-01-01T00:00:00">
+  <properties>
+    <titles><title>%(title)s</title></titles>
+    <authors><author type="words">John Newton</author></authors>
+    <copyright>Public Domain</copyright>
+    <songbooks><songbook name="%(songbook)s" entry="%(number)d"/></songbooks>
+    <verseOrder>%(order)s</verseOrder>
+  </properties>
+  <lyrics>
+%(verses)s
+  </lyrics>
+</song>
+"""
+
+VERSE_NODE = u"""    <verse name="%s"><lines>%s</lines></verse>"""
+
+PRESENTATION = u"""<?xml version='1.0' encoding='UTF-8'?>
+<presentation>
+<meta>
+<title>%(title)s</title>
+</meta>
+<slides>
+<slide title="Welcome"><text>%(title)s</text></slide>
+<slide title="Picture"><image src="%(image)s" aspect="fit" /></slide>
+<slide title="Notes"><text x2="0.5">%(text)s</text>\
+<image src="%(image)s" x1="0.5" aspect="fill" /></slide>
+</slides>
+</presentation>
+"""
+
+SCHEDULE_ITEM = u"""<presentation><file>%s</file><comment /></presentation>"""
+
+THEME = u"""<?xml version='1.0' encoding='UTF-8'?>
+<theme>
+    <meta>
+        <title>%(title)s</title>
+    </meta>
+    <background>
+        <gradient angle='%(angle)d'>
+            <point color='%(color1)s' stop='0.0' />
+            <point color='%(color2)s' stop='1.0' />
+        </gradient>
+        %(image)s
+    </background>
+    <sections>
+        <body font='Sans 48' x1='0.0' x2='1.0' y1='0.0' y2='0.85'>
+            <text color='#fff' />
+            <shadow color='#000' opacity='0.6' offsetx='.1' offsety='.1' />
+        </body>
+        <footer font='Sans 24' x1='0.0' x2='1.0' y1='0.85' y2='1.0'>
+            <text color='#fff' />
+        </footer>
+    </sections>
+</theme>
+"""
+
+THEME_IMAGE = u"""<image src='%s' aspect='fill' />"""
+
+def parse_args():
+    "Return the options of the benchmark."
+    parser = optparse.OptionParser(usage="%prog [options]",
+                                   description="Benchmark the startup of ExpoSong.")
+    parser.add_option('-n', '--songs', dest='songs', default='100,1000,10000',
+                      help='The library sizes, as numbers of songs (default 100,1000,10000).')
+    parser.add_option('-m', '--presentations', dest='presentations', type='int',
+                      help='The number of presentations (default a tenth of the songs).')
+    parser.add_option('-k', '--schedules', dest='schedules', type='int',
+                      default=10, help='The number of schedules (default 10).')
+    parser.add_option('-t', '--themes', dest='themes', type='int', default=6,
+                      help='The number of themes, besides the shipped one (default 6).')
+    parser.add_option('--child', dest='child', nargs=2,
+                      help=optparse.SUPPRESS_HELP)
+    options = parser.parse_args()[0]
+    options.songs = [int(n) for n in options.songs.split(',')]
+    return options
+
+def write(filename, text):
+    "Write the unicode `text` to `filename`."
+    fl = open(filename, 'w')
+    try:
+        fl.write(text.encode('utf-8'))
+    finally:
+        fl.close()
+
+def write_image(filename, color, size=(1920, 1080)):
+    "Save a jpeg image of one color."
+    import gtk.gdk
+    pb = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, *size)
+    pb.fill(color)
+    pb.save(filename, 'jpeg')
+
+def make_data(data, songs, presentations, schedules, themes):
+    "Create the data folder. The same numbers always give the same files."
+    rand = random.Random(songs)
+    pres = os.path.join(data, 'pres')
+    os.makedirs(os.path.join(pres, 'res'))
+    os.makedirs(os.path.join(data, 'sched'))
+    shutil.copytree(os.path.join(ROOT, 'data', 'theme'),
+                    os.path.join(data, 'theme'))
+
+    filenames = []
+    for i in range(songs):
+        order = []
+        verses = []
+        for v in range(1, 5):
+            name = 'v%d' % v
+            order.append(name)
+            lines = [VERSE[(i + v + l) % len(VERSE)] for l in range(4)]
+            verses.append(VERSE_NODE % (name, '<br/>'.join(lines)))
+        filename = 'song-%05d.xml' % i
+        write(os.path.join(pres, filename), SONG % {
+                'title': 'Song %d' % i,
+                'songbook': SONGBOOKS[i % len(SONGBOOKS)],
+                'number': i,
+                'order': ' '.join(order),
+                'verses': '\n'.join(verses)})
+        filenames.append(filename)
+
+    for i in range(IMAGES):
+        write_image(os.path.join(pres, 'res', 'bench-%d.jpg' % i),
+                    rand.randint(0, 0xffffff) << 8 | 0xff)
+    for i in range(presentations):
+        filename = 'pres-%05d.xml' % i
+        write(os.path.join(pres, filename), PRESENTATION % {
+                'title': 'Presentation %d' % i,
+                'image': 'bench-%d.jpg' % (i % IMAGES),
+                'text': '\n'.join(VERSE)})
+        filenames.append(filename)
+
+    for i in range(schedules):
+        items = rand.sample(filenames, min(SCHEDULE_LENGTH, len(filenames)))
+        write(os.path.join(data, 'sched', 'sched-%03d.xml' % i),
+              u"<?xml version='1.0' encoding='UTF-8'?>\n"
+              u'<schedule created="0" modified="0"><title>Schedule %d</title>'
+              u'%s</schedule>\n' % (i, ''.join(SCHEDULE_ITEM % fl
+                                                for fl in items)))
+
+    for i in range(themes):
+        image = ''
+        if i % 2:
+            # Every other theme has a photo as its background.
+            src = 'bench-bg-%d.jpg' % i
+            write_image(os.path.join(data, 'theme', 'res', src),
+                        rand.randint(0, 0xffffff) << 8 | 0xff, (4000, 3000))
+            image = THEME_IMAGE % src
+        write(os.path.join(data, 'theme', 'bench-%02d.xml' % i), THEME % {
+                'title': 'Theme %d' % i,
+                'angle': rand.randint(0, 359),
+                'color1': '#%06x' % rand.randint(0, 0xffffff),
+                'color2': '#%06x' % rand.randint(0, 0xffffff),
+                'image': image})
+
+def write_config(filename):
+    """
+    Write a config file that does not check for updates. The conversion of old
+    formats is marked as done, because it only happens on the first start.
+    """
+    write(filename, u"[general]\nconverted-old-formats = True\n"
+                    u"[updates]\ncheck_for_updates = False\n")
+
+
+class TimedTask(object):
+    """
+    Runs a startup task (a generator stepped by gobject) and adds up the time
+    spent in its steps.
+    """
+    def __init__(self, name, task, done=None):
+        self.name = name
+        self.task = task
+        self.done = done
+        self.busy = 0.0
+        self.started = None
+
+    def next(self):
+        started = timer()
+        if self.started is None:
+            self.started = started
+        try:
+            ret = self.task.next()
+        except StopIteration:
+            ret = False
+        ended = timer()
+        self.busy += ended - started
+        if not ret:
+            record(self.name, self.busy, ended - self.started)
+            if self.done:
+                self.done()
+        return ret
+
+def timed_task(name, method, done=None):
+    "Return a method that times the generator returned by `method`."
+    def wrapper(*args):
+        return TimedTask(name, method(*args), done)
+    return wrapper
+
+def timed_call(name, func):
+    "Return a function that times `func`."
+    def wrapper(*args):
+        started = timer()
+        try:
+            return func(*args)
+        finally:
+            duration = timer() - started
+            record(name, duration, duration)
+    return wrapper
+
+def record(name, busy, wall):
+    "Print the time of a startup part for the parent process."
+    print "PHASE\t%s\t%f\t%f" % (name, busy, wall)
+    sys.stdout.flush()
+
+def run_child(data, conf):
+    "Start ExpoSong and print the time of each part of the startup."
+    sys.argv = [sys.argv[0], '-d', data, '-c', conf]
+    sys.path.insert(0, os.path.join(ROOT, 'lib'))
+
+    started = timer()
+    import exposong
+    record('import', timer() - started, timer() - started)
+    import gtk
+    import exposong.config
+    import exposong.main
+    import exposong.plugins
+    import exposong.themeselect
+    import exposong.version
+    print "VERSION\t%s" % exposong.version.__version__
+
+    timed_call('config', exposong.config.Config)()
+
+    Main = exposong.main.Main
+    ThemeSelect = exposong.themeselect.ThemeSelect
+    waiting = set(['ready', 'thumbnails'])
+    def finished(part):
+        waiting.discard(part)
+        if not waiting:
+            record('total', timer() - started, timer() - started)
+            gtk.main_quit()
+
+    exposong.plugins.load_plugins = timed_call('plugins',
+                                               exposong.plugins.load_plugins)
+    Main.__init__ = timed_call('window', Main.__init__)
+    Main.build_schedule = timed_task('build_schedule', Main.build_schedule)
+    Main.build_pres_list = timed_task('build_pres_list', Main.build_pres_list)
+    ThemeSelect._load_themes = timed_task('load_themes',
+                                          ThemeSelect._load_themes)
+    ThemeSelect._load_theme_thumbs = timed_task('thumbnails',
+            ThemeSelect._load_theme_thumbs, lambda: finished('thumbnails'))
+    ready = Main._ready
+    def _ready(self):
+        ready(self)
+        finished('ready')
+        return False
+    Main._ready = _ready
+
+    exposong.main.run()
+    sys.stdout.flush()
+    # Don't wait for the image threads.
+    os._exit(0)
+
+def start(data, conf):
+    "Start ExpoSong in a new process. Return {phase: (busy, wall)}."
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                             '--child', data, conf], stdout=subprocess.PIPE)
+    output = proc.communicate()[0]
+    if proc.returncode != 0:
+        sys.exit("ExpoSong did not start (exit status %d)." % proc.returncode)
+    times = {}
+    version = None
+    for line in output.splitlines():
+        fields = line.split('\t')
+        if fields[0] == 'PHASE':
+            times[fields[1]] = (float(fields[2]), float(fields[3]))
+        elif fields[0] == 'VERSION':
+            version = fields[1]
+    return version, times
+
+def main():
+    options = parse_args()
+    if options.child:
+        run_child(*options.child)
+        return
+
+    for songs in options.songs:
+        presentations = options.presentations
+        if presentations is None:
+            presentations = songs // 10
+        tmp = tempfile.mkdtemp(prefix='exposong-bench-')
+        try:
+            data = os.path.join(tmp, 'data')
+            conf = os.path.join(tmp, 'exposong.conf')
+            make_data(data, songs, presentations, options.schedules,
+                      options.themes)
+            write_config(conf)
+            results = []
+            for name in ('cold', 'warm'):
+                version, times = start(data, conf)
+                results.append((name, times))
+
+            print
+            print ("ExpoSong %s: %d songs, %d presentations, %d schedules, "
+                   "%d themes" % (version, songs, presentations,
+                                  options.schedules, options.themes + 1))
+            print "  %-16s %10s %10s %10s %10s" % ("part", "cold busy",
+                    "cold wall", "warm busy", "warm wall")
+            for phase in PHASES:
+                row = []
+                for name, times in results:
+                    row.extend(times.get(phase, (0.0, 0.0)))
+                print "  %-16s %10.1f %10.1f %10.1f %10.1f" % ((phase,) +
+                        tuple(t * 1000 for t in row))
+        finally:
+            shutil.rmtree(tmp, True)
+    print
+    print "Times are in milliseconds."
+
+if __name__ == '__main__':
+    main()
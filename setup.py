@@ -71,6 +71,6 @@ setup(name       = 'exposong',
     package_dir  = {'': 'lib'},
     packages     = ['exposong', 'exposong.plugins',
                     'exposong_openlyrics', 'exposong_openlyrics.tools'],
-    py_modules   = ['undobuffer', 'gettext_windows'],
+    py_modules   = ['undobuffer', 'gettext_windows', 'presheader'],
     data_files   = data_files,
     )
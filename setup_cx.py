@@ -94,7 +94,7 @@ setup(name       = 'exposong',
     package_dir  = {'': 'lib'},
     packages     = ['exposong', 'exposong.plugins',
                     'exposong_openlyrics', 'exposong_openlyrics.tools'],
-    py_modules   = ['undobuffer', 'gettext_windows'],#+plugins,
+    py_modules   = ['undobuffer', 'gettext_windows', 'presheader'],#+plugins,
     executables=[Executable(
         script       = 'bin/exposong',
         icon         = 'share/exposong/res/es.ico',
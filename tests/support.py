@@ -0,0 +1,42 @@
+#
+# vim: ts=4 sw=4 expandtab ai:
+#
+# Copyright (C) 2008-2011 Exposong.org
+#
+# ExpoSong is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Sets up the paths for the tests. Run them from the top folder with:
+
+    python -m unittest discover -s tests
+"""
+
+import os.path
+import sys
+import tempfile
+
+LIB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                        os.pardir, 'lib'))
+if LIB_PATH not in sys.path:
+    sys.path.insert(0, LIB_PATH)
+
+def import_exposong():
+    """
+    Prepare the command line so that the exposong package can be imported.
+    It reads the command line when it is imported, and keeps its data in a
+    temporary folder.
+    """
+    if 'exposong' in sys.modules:
+        return
+    sys.argv = [sys.argv[0], '--data-path', tempfile.mkdtemp()]
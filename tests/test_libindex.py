@@ -0,0 +1,91 @@
+#
+# vim: ts=4 sw=4 expandtab ai:
+#
+# Copyright (C) 2008-2011 Exposong.org
+#
+# ExpoSong is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import support
+support.import_exposong()
+from exposong import libindex
+
+
+class LibraryIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "song.xml")
+        self.write("<song>Amazing Grace</song>", 1000000000)
+        self.index = libindex.LibraryIndex(os.path.join(self.directory,
+                                                        "library.idx"))
+        self.entry = libindex.make_file_entry(self.filename)
+        self.entry['type'] = 'song'
+        self.entry['header'] = {'title': 'Amazing Grace'}
+        self.index.set(self.filename, self.entry)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, text, mtime):
+        "Write `text` to the test file, and set its modification time."
+        fl = open(self.filename, 'w')
+        fl.write(text)
+        fl.close()
+        os.utime(self.filename, (mtime, mtime))
+
+    def test_unchanged(self):
+        self.assertEqual(self.index.lookup(self.filename), self.entry)
+
+    def test_missing(self):
+        os.remove(self.filename)
+        self.assertEqual(self.index.lookup(self.filename), None)
+        self.assertEqual(self.index.lookup(os.path.join(self.directory,
+                                                        "other.xml")), None)
+
+    def test_size_changed(self):
+        self.write("<song>Amazing Grace!</song>", 1000000000)
+        self.assertEqual(self.index.lookup(self.filename), None)
+
+    def test_contents_changed(self):
+        # The same size, but a different hash.
+        self.write("<song>Amazing Glory</song>", 1000000100)
+        self.assertEqual(self.index.lookup(self.filename), None)
+
+    def test_touched(self):
+        # Only the modification time changed, so the entry is kept.
+        self.write("<song>Amazing Grace</song>", 1000000100)
+        entry = self.index.lookup(self.filename)
+        self.assertEqual(entry['header'], {'title': 'Amazing Grace'})
+        self.assertEqual(entry['mtime'], os.stat(self.filename).st_mtime)
+
+    def test_save(self):
+        self.index.save()
+        index = libindex.LibraryIndex(self.index.filename)
+        self.assertEqual(index.lookup(self.filename), self.entry)
+        self.write("<song>Amazing Glory</song>", 1000000100)
+        self.assertEqual(index.lookup(self.filename), None)
+
+    def test_remove(self):
+        self.index.remove(self.filename)
+        self.assertEqual(self.index.lookup(self.filename), None)
+        self.assertEqual(len(self.index), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
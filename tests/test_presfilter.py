@@ -0,0 +1,98 @@
+#
+# vim: ts=4 sw=4 expandtab ai:
+#
+# Copyright (C) 2008-2011 Exposong.org
+#
+# ExpoSong is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import support
+support.import_exposong()
+import presheader
+from exposong.presfilter import SearchIndex
+
+
+class Pres(object):
+    "A presentation with only search fields."
+    def __init__(self, **fields):
+        self.fields = dict((k.replace('_', '-'), sorted(presheader.tokenize(v)))
+                           for k, v in fields.iteritems())
+
+    def get_search_fields(self):
+        return self.fields
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.grace = Pres(title=u"Amazing Grace", text=u"How sweet the sound")
+        self.glory = Pres(title=u"Glory", first_line=u"Amazing love",
+                          info=u"Gr\xe2ce")
+        self.other = Pres(title=u"Holy Holy Holy")
+        for pres in (self.grace, self.glory, self.other):
+            self.index.add(pres)
+
+    def test_find_prefix(self):
+        self.assertEqual(self.index.find_prefix(u"amazing"),
+                         {self.grace: 8, self.glory: 4})
+        # Partly matched words count for half.
+        self.assertEqual(self.index.find_prefix(u"gr"),
+                         {self.grace: 4, self.glory: 0.5})
+        self.assertEqual(self.index.find_prefix(u"zz"), {})
+
+    def test_search(self):
+        self.assertEqual(self.index.search(u"amaz gra"),
+                         {self.grace: 8, self.glory: 2.5})
+        self.assertEqual(self.index.search(u"Gr\xe2ce sweet"),
+                         {self.grace: 10})
+        self.assertEqual(self.index.search(u"holy missing"), {})
+        self.assertEqual(self.index.search(u"?!"), None)
+
+    def test_search_within(self):
+        self.assertEqual(self.index.search(u"amazing", [self.glory]),
+                         {self.glory: 4})
+        self.assertEqual(self.index.search(u"holy", [self.grace]), {})
+
+    def test_search_steps(self):
+        many = Pres(text=u" ".join(u"word%04d" % i for i in range(1200)))
+        self.index.add(many)
+        steps = list(self.index.search_steps(u"word amazing"))
+        self.assertTrue(len(steps) > 2)
+        self.assertEqual(steps[:-1], [None] * (len(steps) - 1))
+        self.assertEqual(steps[-1], {})
+        steps = list(self.index.search_steps(u"word"))
+        self.assertEqual(steps[-1], {many: 1})
+        self.assertEqual(self.index.search(u"wor", [many, self.grace]),
+                         {many: 1})
+        self.assertEqual(list(self.index.search_steps(u"?!")), [None])
+
+    def test_update(self):
+        revision = self.index.get_revision()
+        self.grace.fields = {'title': [u"wonderful"]}
+        self.index.update(self.grace)
+        self.assertNotEqual(self.index.get_revision(), revision)
+        self.assertEqual(self.index.search(u"amazing"), {self.glory: 4})
+        self.assertEqual(self.index.search(u"wonder"), {self.grace: 4})
+
+    def test_remove(self):
+        revision = self.index.get_revision()
+        self.index.remove(self.other)
+        self.assertNotEqual(self.index.get_revision(), revision)
+        self.assertEqual(self.index.search(u"holy"), {})
+        self.assertEqual(len(self.index), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#
+# vim: ts=4 sw=4 expandtab ai:
+#
+# Copyright (C) 2008-2011 Exposong.org
+#
+# ExpoSong is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import support
+import presheader
+
+
+class NormalizeTest(unittest.TestCase):
+    def test_accents(self):
+        self.assertEqual(presheader.normalize(u"Jes\xfas"), u"jesus")
+        self.assertEqual(presheader.normalize(u"\xc9glise na\xefve"),
+                         u"eglise naive")
+
+    def test_sharp_s(self):
+        self.assertEqual(presheader.normalize(u"Stra\xdfe"), u"strasse")
+        self.assertEqual(presheader.normalize(u"GRO\xdf"), u"gross")
+
+    def test_case(self):
+        self.assertEqual(presheader.normalize(u"Amazing GRACE"),
+                         u"amazing grace")
+
+
+class TokenizeTest(unittest.TestCase):
+    def test_words(self):
+        self.assertEqual(presheader.tokenize(u"Jes\xfas, my Lord!"),
+                         set([u"jesus", u"my", u"lord"]))
+
+    def test_utf8(self):
+        self.assertEqual(presheader.tokenize("Gro\xc3\x9f ist"),
+                         set([u"gross", u"ist"]))
+
+    def test_punctuation(self):
+        # Apostrophes are removed instead of splitting the word.
+        self.assertEqual(presheader.tokenize(u"Don't stop."),
+                         set([u"dont", u"stop"]))
+
+    def test_lists(self):
+        self.assertEqual(presheader.tokenize([u"Caf\xe9", (u"Na\xefve", None)]),
+                         set([u"cafe", u"naive"]))
+        self.assertEqual(presheader.tokenize(None), set())
+        self.assertEqual(presheader.tokenize(3), set([u"3"]))
+
+
+if __name__ == '__main__':
+    unittest.main()